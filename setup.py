@@ -21,6 +21,7 @@ setuptools.setup(
     ],
     install_requires=[
         'profig',
+        'requests',
         'requests-cache',
         'cli-print',
         'ip-query',
@@ -29,5 +30,13 @@ setuptools.setup(
         'common-patterns',
         'proxychains-conf-generator',
     ],
+    extras_require={
+        'crypto': ['cryptography'],
+    },
+    entry_points={
+        'console_scripts': [
+            'ssr-utils = ssr_utils.cli:main',
+        ],
+    },
 )
 
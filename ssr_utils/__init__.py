@@ -1,4 +1,24 @@
 # coding:utf-8
 from .ssr import *
+from .aio import AsyncSSR
+from .pool import SSRProcessPool
+from .ports import PortAllocator, PortLease
+from .cache import ResultCache
+from .scan import scan_urls, scan_file
+from .prescreen import Prescreen
+from .gateway import Gateway
+from .scheduler import Scheduler, CheckHistory
+from .resolver import Resolver, default_resolver, resolve_servers
+from .node import Node, fingerprint, parse_url, parse_urls, config_json, export_configs, \
+    encode_url, iter_subscription, write_subscription
+from .settings import Settings, get_settings, set_settings, reload_settings
+from .subscribe import SubscriptionClient
+from .index import NodeIndex, IndexDiff
+from .probe import ConnectivityProbe
+from .geoip import GeoIPDatabase
+from .pre_proxy import PreProxyManager
+from .bench import rank as rank_benchmarks
+from .metrics import Metrics, default_metrics
+from .output import set_silent
 
 name = 'ssr-utils'
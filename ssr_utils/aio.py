@@ -0,0 +1,367 @@
+# coding:utf-8
+import os
+import ssl
+import sys
+import json
+import time
+import socket
+import asyncio
+import proxy_fn
+import common_patterns
+import ip_query
+from .ssr import SSR
+from .errors import *
+from .resolver import default_resolver
+from .settings import Settings
+from .settings import get_settings
+from .ports import PortAllocator
+from .ports import get_port_allocator
+from .cache import get_result_cache
+from .supervise import reject_reason
+from .supervise import LOCAL_FAILURES
+from .prescreen import get_prescreen
+from .net import USER_AGENT
+from .net import SOCKS5_GREETING
+from .net import SOCKS5_NO_AUTH
+from .net import socks5_request
+from .net import socks5_check_reply
+from .output import cp
+
+# exit IP services, (host, path, map of IP_DICT key -> response key)
+EXIT_IP_SERVICES = [
+    ('api.ip.sb', '/geoip', {
+        'ip': 'ip',
+        'country': 'country',
+        'country_code': 'country_code',
+        'asn': 'asn',
+        'aso': 'organization',
+    }),
+    ('api.ipify.org', '/?format=json', {
+        'ip': 'ip',
+    }),
+]
+
+
+async def socks5_connect(proxy_host: str, proxy_port: int, host: str, port: int):
+    loop = asyncio.get_event_loop()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, (proxy_host, proxy_port))
+
+        await loop.sock_sendall(sock, SOCKS5_GREETING)
+        if await _sock_recv_exactly(sock, 2) != SOCKS5_NO_AUTH:
+            raise ConnectionError('SOCKS5 handshake refused by {}:{}'.format(proxy_host, proxy_port))
+
+        await loop.sock_sendall(sock, socks5_request(host, port))
+        size = socks5_check_reply(await _sock_recv_exactly(sock, 4), host, port)
+        if size is None:
+            size = (await _sock_recv_exactly(sock, 1))[0] + 2
+        await _sock_recv_exactly(sock, size)
+
+        return sock
+
+    except BaseException:
+        sock.close()
+        raise
+
+
+async def _sock_recv_exactly(sock, n: int):
+    loop = asyncio.get_event_loop()
+
+    data = b''
+    while len(data) < n:
+        chunk = await loop.sock_recv(sock, n - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed by the proxy')
+        data += chunk
+    return data
+
+
+async def http_get(proxy_host: str, proxy_port: int, host: str, path: str = '/', use_ssl: bool = True):
+    sock = await socks5_connect(proxy_host, proxy_port, host, 443 if use_ssl else 80)
+
+    if use_ssl:
+        reader, writer = await asyncio.open_connection(sock=sock,
+                                                       ssl=ssl.create_default_context(),
+                                                       server_hostname=host)
+    else:
+        reader, writer = await asyncio.open_connection(sock=sock)
+
+    try:
+        # HTTP/1.0, so the body is never chunked
+        writer.write('GET {path} HTTP/1.0\r\n'
+                     'Host: {host}\r\n'
+                     'User-Agent: {ua}\r\n'
+                     'Accept: application/json\r\n'
+                     'Connection: close\r\n\r\n'.format(path=path, host=host, ua=USER_AGENT).encode('utf-8'))
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+
+    head, _, body = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    return status, body
+
+
+async def ip_query_by_socks5(proxy_host: str, proxy_port: int, timeout: float = ip_query.TIMEOUT):
+    for host, path, keys in EXIT_IP_SERVICES:
+        try:
+            status, body = await asyncio.wait_for(http_get(proxy_host, proxy_port, host, path), timeout)
+            if 200 != status:
+                cp.error('[{}] status: {}'.format(host, status))
+                continue
+
+            data = json.loads(body.decode('utf-8'))
+            ip = ip_query.IP_DICT.copy()
+            for key, data_key in keys.items():
+                ip[key] = data.get(data_key)
+
+            # with GEO
+            if ip_query.geo_missed(ip):
+                geo = await asyncio.get_event_loop().run_in_executor(None, ip_query.geoip, ip['ip'])
+                if geo:
+                    return geo
+
+            return ip
+
+        except Exception as e:
+            cp.error('[{}] {}'.format(host, e or type(e).__name__))
+
+    return None
+
+
+async def acquire_port(allocator: PortAllocator):
+    # poll, the lock files may be held by other processes
+    delay = 0.05
+    while True:
+        lease = allocator.try_acquire()
+        if lease:
+            return lease
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+class AsyncSSR(SSR):
+    def __init__(self, path_to_config: str = 'config.ini', settings=None):
+        super().__init__(path_to_config=path_to_config, settings=settings)
+        self._process = None
+
+    async def resolve_server_ip(self):
+        if self._server_ip:
+            return self._server_ip
+
+        # ip == server?
+        if common_patterns.is_ip_address(self.server):
+            self._server_ip = self.server
+            return self._server_ip
+
+        # domain
+        self._server_domain = self.server
+
+        ips = default_resolver.cached(self._server_domain)
+        if ips is None:
+            try:
+                infos = await asyncio.get_event_loop().getaddrinfo(self._server_domain, self.port,
+                                                                   type=socket.SOCK_STREAM)
+                ips = [info[4][0] for info in sorted(infos, key=lambda info: info[0] != socket.AF_INET)]
+            except (socket.gaierror, UnicodeError):
+                ips = list()
+            default_resolver.store(self._server_domain, ips)
+
+        if not ips:
+            cp.error('Cannot resolve "{}".'.format(self._server_domain))
+            return None
+
+        self._server_ip = ips[0]
+        return self._server_ip
+
+    @property
+    def is_available(self):
+        return self.get_available()
+
+    async def get_available(self, cache=None):
+        if self.invalid_attributes:
+            return None
+
+        # check system
+        if 'win32' == sys.platform:
+            raise SystemNotSupportedException('Cannot use property `is_available` in windows.')
+
+        # known-bad, e.g. an AEAD cipher, not worth a sub progress
+        self._from_cache = False
+        reason = reject_reason(self)
+        if reason:
+            cp.error('Rejected: {}.'.format(reason))
+            self._failure = 'rejected'
+            return None
+
+        # `None` falls back to `ssr_utils.result_cache`, `True` is the cache of the settings
+        if cache is None:
+            cache = self._cfg['ssr_utils.result_cache']
+        if cache is True:
+            cache = get_result_cache(self._cfg)
+
+        key = self.fingerprint
+        if cache:
+            hit, ip = cache.get(key)
+            if hit:
+                self._from_cache = True
+                if ip:
+                    self._exit_ip = ip
+                return ip
+
+        if self._local_port:
+            ip = await self.__get_available()
+        else:
+            # a free port of the range, leased until the SSR sub progress is killed
+            with await acquire_port(get_port_allocator(self._cfg)) as lease:
+                self.local_port = lease.port
+                try:
+                    ip = await self.__get_available()
+                finally:
+                    self.local_port = None
+
+        if cache and (ip or self._failure not in LOCAL_FAILURES):
+            cache.store(key, ip)
+        return ip
+
+    async def __get_available(self):
+        loop = asyncio.get_event_loop()
+        self._failure = None
+
+        # pc4 may validate pre-proxies, keep it off the loop
+        pc4_conf_file = await loop.run_in_executor(None, lambda: self.pc4_conf_file)
+
+        # a TCP connect first, most dead nodes end here
+        if not pc4_conf_file and self._cfg['ssr_utils.prescreen']:
+            if not await asyncio.wrap_future(get_prescreen(self._cfg).submit(self.server, self.port)):
+                cp.error('Cannot connect to {}:{}.'.format(self.server, self.port))
+                self._failure = 'unreachable'
+                return None
+
+        self._set_check_cmd(pc4_conf_file=pc4_conf_file)
+
+        try:
+            # By server_ip
+            if await self.resolve_server_ip():
+                self._prepare_config(by_ip=True)
+                ip = await self.__ip_query()
+                if ip:
+                    self._set_server(self._server_ip)
+                    return ip
+
+            # By server/domain
+            if self._server_ip != self.server:
+                self._prepare_config()
+                return await self.__ip_query()
+
+            return None
+
+        finally:
+            self._remove_ssr_conf()
+
+    async def __ip_query(self):
+        cmd = self._cmd.split()
+        self._process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if self._config_json else None,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        if self._config_json:
+            try:
+                self._process.stdin.write(self._config_json.encode('utf-8'))
+                self._process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        ip = None
+        try:
+            if await self.__wait_for_local_port():
+                start = time.time()
+                ip = await self.__lookup_exit_ip()
+                if ip and ip.get('latency') is None:
+                    ip['latency'] = time.time() - start
+        except Exception as e:
+            cp.error(e)
+        finally:
+            try:
+                os.killpg(self._process.pid, 9)
+            except ProcessLookupError:
+                pass
+            await self._process.wait()
+
+        if ip:
+            self._exit_ip = ip
+            return ip
+
+        return None
+
+    async def __lookup_exit_ip(self):
+        # the probe or a lookup of one's own, like the sync check, in a thread, else the built-in async query
+        if self._exit_ip_lookup is None and not self._cfg['ssr_utils.probe_url']:
+            return await ip_query_by_socks5(self.local_address, self.local_port)
+
+        requests_proxies = proxy_fn.requests_proxies(host=self.local_address, port=self.local_port)
+        return await asyncio.get_event_loop().run_in_executor(
+            None, lambda: self.exit_ip_lookup(requests_proxies=requests_proxies))
+
+    async def __wait_for_local_port(self):
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self._cfg['ssr_utils.startup_timeout']
+        delay = 0.05
+        while loop.time() < deadline:
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.local_address, self.local_port), 0.2)
+                writer.close()
+                return True
+            except (OSError, asyncio.TimeoutError):
+                pass
+
+            if self._process.returncode is not None:
+                return False
+
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+            delay = min(delay * 2, 0.5)
+
+        return False
+
+    @staticmethod
+    async def check_many(urls,
+                         workers: int = 64,
+                         local_port: int = None,
+                         path_to_config: str = 'config.ini',
+                         settings=None,
+                         cache=None,
+                         ):
+        if isinstance(settings, dict):
+            settings = Settings(settings)
+        if local_port:
+            allocator = PortAllocator(port_min=local_port, port_max=local_port + workers - 1)
+        else:
+            allocator = get_port_allocator(settings or get_settings(path_to_config))
+        semaphore = asyncio.Semaphore(workers)
+
+        async def check(url: str):
+            async with semaphore:
+                lease = await acquire_port(allocator)
+                try:
+                    ssr = AsyncSSR(path_to_config, settings=settings)
+                    ssr.url = url
+                    ssr.local_port = lease.port
+                    return url, await ssr.get_available(cache=cache)
+                except SystemNotSupportedException:
+                    raise
+                except Exception as e:
+                    cp.error(e)
+                    return url, None
+                finally:
+                    lease.release()
+
+        for task in asyncio.as_completed([check(url) for url in urls]):
+            yield await task
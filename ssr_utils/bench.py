@@ -0,0 +1,124 @@
+# coding:utf-8
+import ssl
+import math
+import time
+import urllib.parse
+from .net import USER_AGENT
+from .net import socks5_socket
+
+DEFAULT_BENCH_URL = 'https://speed.cloudflare.com/__down?bytes=1000000'
+
+
+def sample(proxy_host: str, proxy_port: int, url: str = DEFAULT_BENCH_URL, timeout: float = 10):
+    u = urllib.parse.urlsplit(url)
+    use_ssl = u.scheme == 'https'
+    port = u.port or (443 if use_ssl else 80)
+    path = (u.path or '/') + ('?' + u.query if u.query else '')
+
+    # connect, SOCKS5 CONNECT and the TLS handshake, so https covers a round trip through the tunnel
+    start = time.time()
+    sock = socks5_socket(proxy_host, proxy_port, u.hostname, port, timeout=timeout)
+    try:
+        if use_ssl:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=u.hostname)
+        connect_time = time.time() - start
+
+        # time to first byte
+        sock.sendall('GET {path} HTTP/1.0\r\n'
+                     'Host: {host}\r\n'
+                     'User-Agent: {ua}\r\n'
+                     'Connection: close\r\n\r\n'.format(path=path, host=u.hostname, ua=USER_AGENT).encode('utf-8'))
+        sent = time.time()
+        data = sock.recv(65536)
+        if not data:
+            raise ConnectionError('Empty response from {}'.format(url))
+        first_byte = time.time()
+
+        # throughput, of the body
+        while b'\r\n\r\n' not in data:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        head, _, body = data.partition(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        size = len(body)
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            size += len(chunk)
+        duration = time.time() - first_byte
+
+    finally:
+        sock.close()
+
+    return {
+        'status': status,
+        'connect': connect_time,
+        'ttfb': first_byte - sent,
+        'bytes': size,
+        'throughput': size / duration if duration > 0 else 0.0,
+    }
+
+
+def percentile(values: list, p: float):
+    # nearest rank
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values), max(1, math.ceil(p / 100 * len(values)))) - 1]
+
+
+def summarize(values: list):
+    if not values:
+        return None
+
+    # mean absolute difference between consecutive samples
+    jitter = 0.0
+    if len(values) > 1:
+        jitter = sum(abs(values[i] - values[i - 1]) for i in range(1, len(values))) / (len(values) - 1)
+
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'mean': sum(values) / len(values),
+        'jitter': jitter,
+    }
+
+
+def benchmark_tunnel(proxy_host: str,
+                     proxy_port: int,
+                     url: str = DEFAULT_BENCH_URL,
+                     samples: int = 5,
+                     timeout: float = 10,
+                     ):
+    results = list()
+    failures = 0
+    for i in range(0, samples):
+        try:
+            result = sample(proxy_host, proxy_port, url=url, timeout=timeout)
+            if result['status'] < 400:
+                results.append(result)
+                continue
+        except (OSError, ValueError, IndexError):
+            pass
+        failures += 1
+
+    if not results:
+        return None
+
+    return {
+        'url': url,
+        'samples': len(results),
+        'failures': failures,
+        'connect': summarize([r['connect'] for r in results]),
+        'ttfb': summarize([r['ttfb'] for r in results]),
+        'throughput': summarize([r['throughput'] for r in results]),
+    }
+
+
+def rank(results):
+    # (url, benchmark) pairs, the fastest and steadiest first
+    results = [(url, b) for url, b in results if b]
+    return sorted(results, key=lambda x: (x[1]['failures'], x[1]['ttfb']['p50'], -x[1]['throughput']['p50']))
@@ -0,0 +1,103 @@
+# coding:utf-8
+import os
+import json
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+
+
+class ResultCache:
+    def __init__(self,
+                 path_to_db: str = os.path.join(tempfile.gettempdir(), 'ssr_utils_results.sqlite'),
+                 ttl: float = 600,
+                 negative_ttl: float = 120,
+                 jitter: float = 0.1,
+                 ):
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._jitter = jitter
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path_to_db, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                           'fingerprint TEXT PRIMARY KEY, '
+                           'ok INTEGER NOT NULL, '
+                           'ip TEXT, '
+                           'country_code TEXT, '
+                           'latency REAL, '
+                           'result TEXT, '
+                           'checked_at REAL NOT NULL, '
+                           'expires_at REAL NOT NULL)')
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, key: str):
+        # (hit, result), a hit of a failed check is (True, None)
+        with self._lock:
+            row = self._conn.execute('SELECT ok, result FROM results WHERE fingerprint = ? AND expires_at > ?',
+                                     (key, time.time())).fetchone()
+        if row is None:
+            return False, None
+        if not row[0]:
+            return True, None
+        return True, json.loads(row[1])
+
+    def store(self, key: str, result: dict = None):
+        # jittered, so nodes checked together do not expire together
+        now = time.time()
+        ttl = self._ttl if result else self._negative_ttl
+        expires_at = now + ttl * (1 + random.uniform(-self._jitter, self._jitter))
+
+        result = result or None
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                key,
+                1 if result else 0,
+                result.get('ip') if result else None,
+                result.get('country_code') if result else None,
+                result.get('latency') if result else None,
+                json.dumps(result, ensure_ascii=False) if result else None,
+                now,
+                expires_at,
+            ))
+
+    def discard(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM results WHERE fingerprint = ?', (key,))
+
+    def purge(self):
+        # expired rows
+        with self._lock, self._conn:
+            return self._conn.execute('DELETE FROM results WHERE expires_at <= ?', (time.time(),)).rowcount
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM results')
+
+
+_lock = threading.Lock()
+_caches = dict()
+
+
+def get_result_cache(settings):
+    # one per database, shared by all checks in the process
+    path_to_db = settings['ssr_utils.path_to_result_cache'] or \
+        os.path.join(tempfile.gettempdir(), 'ssr_utils_results.sqlite')
+    with _lock:
+        if path_to_db not in _caches:
+            _caches[path_to_db] = ResultCache(
+                path_to_db=path_to_db,
+                ttl=settings['ssr_utils.result_ttl'],
+                negative_ttl=settings['ssr_utils.result_negative_ttl'],
+            )
+        return _caches[path_to_db]
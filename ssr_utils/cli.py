@@ -0,0 +1,193 @@
+# coding:utf-8
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from .ssr import SSR
+from .ssr import get_urls_by_subscribe
+from .node import parse_url
+from .node import fingerprint
+from .settings import Settings
+from .settings import get_settings
+from .output import set_silent
+
+
+def iter_urls(paths, subscribe_urls=None, request_proxies=None):
+    # files, `-` for stdin, then subscriptions
+    for path in paths or list():
+        f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', errors='ignore')
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    for subscribe_url in subscribe_urls or list():
+        for url in get_urls_by_subscribe(subscribe_url, request_proxies=request_proxies):
+            yield url
+
+
+def load_checkpoint(path_to_checkpoint: str):
+    # one URL per line, every one of them checked already
+    if not path_to_checkpoint or not os.path.exists(path_to_checkpoint):
+        return set()
+    with open(path_to_checkpoint, 'r', encoding='utf-8') as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def _stdout_to_stderr():
+    # `ip_query` and others print on their own, keep stdout for the JSON lines
+    sys.stdout.flush()
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+
+def _worker(index: int, settings: Settings, threads: int, in_queue, out_queue):
+    # one long-lived `check_many`, on a port range of its own, `threads` ports wide
+    set_silent()
+    _stdout_to_stderr()
+
+    settings = settings.replace({
+        'ssr_utils.local_port': settings['ssr_utils.local_port'] + index * threads,
+        'ssr_utils.port_range': threads,
+    })
+    try:
+        for url, result in SSR.check_many(iter(in_queue.get, None), workers=threads, settings=settings):
+            out_queue.put((url, result))
+    finally:
+        out_queue.put(None)
+
+
+def _feed(urls, in_queue, processes: int, errors: list):
+    try:
+        for url in urls:
+            in_queue.put(url)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        for _ in range(0, processes):
+            in_queue.put(None)
+
+
+def _record(url: str, result):
+    node = None
+    try:
+        node = parse_url(url)
+    except Exception:
+        pass
+
+    return {
+        'url': url,
+        'fingerprint': fingerprint(node) if node else None,
+        'available': bool(result),
+        'result': result,
+        'time': int(time.time()),
+    }
+
+
+def check(args):
+    settings = get_settings(args.config)
+    done = load_checkpoint(args.checkpoint) if args.resume else set()
+    urls = (url for url in iter_urls(args.files, args.subscribe) if url not in done)
+
+    if args.output:
+        output = open(args.output, 'a', encoding='utf-8')
+    else:
+        output = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+        _stdout_to_stderr()
+    checkpoint = open(args.checkpoint, 'a', encoding='utf-8') if args.checkpoint else None
+
+    # bounded, so a list of 100k is read as it goes
+    in_queue = multiprocessing.Queue(maxsize=args.processes * args.threads * 4)
+    out_queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker,
+                                       args=(i, settings, args.threads, in_queue, out_queue),
+                                       daemon=True,
+                                       ) for i in range(0, args.processes)]
+    for worker in workers:
+        worker.start()
+
+    errors = list()
+    threading.Thread(target=_feed, args=(urls, in_queue, args.processes, errors), daemon=True).start()
+
+    running = len(workers)
+    try:
+        while running:
+            try:
+                item = out_queue.get(timeout=1)
+            except queue.Empty:
+                # crashed, without saying it is done
+                if not any(worker.is_alive() for worker in workers):
+                    break
+                continue
+
+            if item is None:
+                running -= 1
+                continue
+
+            # one by one, a slow node holds nothing else up
+            url, result = item
+            output.write(json.dumps(_record(url, result), ensure_ascii=False) + '\n')
+            output.flush()
+
+            # after the output, so an interrupted run never loses a result
+            if checkpoint:
+                checkpoint.write(url + '\n')
+                checkpoint.flush()
+
+    except KeyboardInterrupt:
+        _terminate(workers, in_queue)
+        return 130
+    except BaseException:
+        _terminate(workers, in_queue)
+        raise
+    finally:
+        for worker in workers:
+            worker.join(5)
+        output.close()
+        if checkpoint:
+            checkpoint.close()
+
+    if errors:
+        raise errors[0]
+    return 0
+
+
+def _terminate(workers, in_queue):
+    in_queue.cancel_join_thread()
+    for worker in workers:
+        worker.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ssr_utils', description='Shadowsocks(R) utils.')
+    commands = parser.add_subparsers(dest='command')
+
+    p = commands.add_parser('check', help='check URLs, one JSON line per URL')
+    p.add_argument('files', nargs='*', help='files of URLs, one per line, `-` for stdin')
+    p.add_argument('-s', '--subscribe', action='append', default=list(), help='subscription URL')
+    p.add_argument('-c', '--config', default='config.ini', help='path to config.ini')
+    p.add_argument('-o', '--output', help='append JSON lines to this file, instead of stdout')
+    p.add_argument('-p', '--processes', type=int, default=os.cpu_count() or 1)
+    p.add_argument('-t', '--threads', type=int, default=8, help='checks in flight per process')
+    p.add_argument('--checkpoint', help='URLs done, appended as it goes')
+    p.add_argument('--no-resume', dest='resume', action='store_false',
+                   help='check everything, even what the checkpoint has done')
+    p.set_defaults(fn=check)
+
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return 2
+
+    if args.command == 'check' and not args.files and not args.subscribe:
+        args.files = ['-']
+
+    return args.fn(args)
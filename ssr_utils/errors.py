@@ -8,3 +8,6 @@ class SystemNotSupportedException(Exception):
 class IpAddressInvalid(Exception):
     pass
 
+
+class NoAvailablePreProxy(Exception):
+    pass
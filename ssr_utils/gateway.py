@@ -0,0 +1,294 @@
+# coding:utf-8
+import time
+import random
+import select
+import socket
+import threading
+import itertools
+import socketserver
+from .ssr import SSR
+from .net import socks5_reply
+from .net import socks5_socket
+from .net import socks5_accept
+from .output import cp
+
+STRATEGIES = ('round_robin', 'least_conn', 'latency')
+
+
+class Tunnel:
+    def __init__(self, url: str, ssr: SSR):
+        self.url = url
+        self.ssr = ssr
+        self.active = 0
+        self.connections = 0
+        self.failures = 0
+
+        # EWMA of the connect time through it, from the exit IP check at first
+        self.latency = (ssr.exit_ip or dict()).get('latency') or 1.0
+
+    def __repr__(self):
+        return '<Tunnel {}:{} {}>'.format(self.ssr.local_address, self.ssr.local_port, self.ssr.server)
+
+    def to_dict(self):
+        return {
+            'server': self.ssr.server,
+            'local_port': self.ssr.local_port,
+            'exit_ip': (self.ssr.exit_ip or dict()).get('ip'),
+            'active': self.active,
+            'connections': self.connections,
+            'failures': self.failures,
+            'latency': self.latency,
+        }
+
+
+class Gateway:
+    def __init__(self,
+                 candidates,
+                 size: int = 4,
+                 host: str = '127.0.0.1',
+                 port: int = 1080,
+                 strategy: str = 'round_robin',
+                 max_failures: int = 3,
+                 health_interval: float = 30,
+                 timeout: float = 10,
+                 path_to_config: str = 'config.ini',
+                 settings=None,
+                 ):
+        if strategy not in STRATEGIES:
+            raise ValueError('Unknown strategy `{}`, one of {}.'.format(strategy, ', '.join(STRATEGIES)))
+
+        # URLs, tried in turn whenever a tunnel is missing
+        candidates = list(candidates)
+        self._candidates = itertools.cycle(candidates)
+        self._candidate_count = len(candidates)
+        self._size = size
+        self._strategy = strategy
+        self._max_failures = max_failures
+        self._health_interval = health_interval
+        self._timeout = timeout
+        self._path_to_config = path_to_config
+        self._settings = settings
+
+        self._lock = threading.Lock()
+        self._tunnels = list()
+        self._round_robin = 0
+        self._refill = threading.Event()
+        self._stopped = threading.Event()
+        self._verified_at = time.time()
+        self._threads = list()
+
+        gateway = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                gateway._handle(self.request)
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def tunnels(self):
+        with self._lock:
+            return [tunnel.to_dict() for tunnel in self._tunnels]
+
+    def start(self, wait: bool = True):
+        self._server.server_bind()
+        self._server.server_activate()
+
+        for target in (self._server.serve_forever, self.__maintain):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        self._refill.set()
+        if wait:
+            # the first tunnel, or all candidates tried
+            while not self._stopped.is_set() and not self._tunnels and self._refill.is_set():
+                time.sleep(0.1)
+
+    def stop(self):
+        self._stopped.set()
+        self._refill.set()
+        self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join(self._timeout)
+
+        with self._lock:
+            tunnels, self._tunnels = self._tunnels, list()
+        for tunnel in tunnels:
+            tunnel.ssr.close_tunnel()
+
+    def pick(self, exclude=()):
+        with self._lock:
+            tunnels = [tunnel for tunnel in self._tunnels if tunnel not in exclude]
+            if not tunnels:
+                return None
+
+            if self._strategy == 'least_conn':
+                tunnel = min(tunnels, key=lambda t: (t.active, t.latency))
+            elif self._strategy == 'latency':
+                tunnel = random.choices(tunnels, weights=[1 / max(t.latency, 0.001) for t in tunnels])[0]
+            else:
+                self._round_robin = (self._round_robin + 1) % len(tunnels)
+                tunnel = tunnels[self._round_robin]
+
+            tunnel.active += 1
+            tunnel.connections += 1
+            return tunnel
+
+    def _handle(self, client: socket.socket):
+        client.settimeout(self._timeout)
+        try:
+            host, port = socks5_accept(client)
+        except (OSError, ValueError, IndexError):
+            return
+
+        # another tunnel, if the first one could not connect
+        tried = list()
+        upstream = None
+        while upstream is None and len(tried) < 2:
+            tunnel = self.pick(exclude=tried)
+            if tunnel is None:
+                break
+            tried.append(tunnel)
+
+            start = time.time()
+            try:
+                upstream = socks5_socket(tunnel.ssr.local_address, tunnel.ssr.local_port, host, port,
+                                         timeout=self._timeout)
+                self.__latency(tunnel, time.time() - start)
+            except OSError:
+                self.__release(tunnel)
+                self.__failure(tunnel)
+
+        if upstream is None:
+            # general failure
+            client.sendall(socks5_reply(1))
+            return
+
+        received = 0
+        try:
+            client.sendall(socks5_reply())
+            received = self.__relay(client, upstream)
+        finally:
+            # SSR accepts locally whatever the server does, nothing back is what a dead server looks like
+            if received:
+                self.__success(tunnel)
+            else:
+                self.__failure(tunnel)
+            upstream.close()
+            self.__release(tunnel)
+
+    @staticmethod
+    def __relay(a: socket.socket, b: socket.socket):
+        # bytes from `b`, the upstream, until both sides are done, a half-close is passed on
+        a.settimeout(None)
+        b.settimeout(None)
+        peers = {a: b, b: a}
+        sockets = [a, b]
+        received = 0
+        try:
+            while sockets:
+                readable, _, _ = select.select(sockets, [], [], 300)
+                if not readable:
+                    return received
+                for s in readable:
+                    data = s.recv(65536)
+                    if not data:
+                        # nothing more from `s`, the other way may still be busy, e.g. the response
+                        sockets.remove(s)
+                        peers[s].shutdown(socket.SHUT_WR)
+                        continue
+                    if s is b:
+                        received += len(data)
+                    peers[s].sendall(data)
+        except OSError:
+            # reset by either side, what came through still counts
+            pass
+        return received
+
+    def __latency(self, tunnel: Tunnel, latency: float):
+        with self._lock:
+            tunnel.latency = tunnel.latency * 0.8 + latency * 0.2
+
+    def __success(self, tunnel: Tunnel):
+        with self._lock:
+            tunnel.failures = 0
+
+    def __failure(self, tunnel: Tunnel):
+        with self._lock:
+            tunnel.failures += 1
+            if tunnel.failures >= self._max_failures:
+                self._refill.set()
+
+    def __release(self, tunnel: Tunnel):
+        with self._lock:
+            tunnel.active -= 1
+
+    def __maintain(self):
+        # evict failing or dead tunnels, fill up from the candidates, in the background
+        while not self._stopped.is_set():
+            self._refill.wait(self._health_interval)
+            if self._stopped.is_set():
+                return
+
+            # the exit IP through each tunnel, once per interval, a dead server keeps the local port open
+            if time.time() - self._verified_at >= self._health_interval:
+                self._verified_at = time.time()
+                with self._lock:
+                    tunnels = list(self._tunnels)
+                for tunnel in tunnels:
+                    if self._stopped.is_set():
+                        return
+                    if not tunnel.ssr.verify_tunnel():
+                        with self._lock:
+                            tunnel.failures = max(tunnel.failures, self._max_failures)
+
+            with self._lock:
+                evicted = [t for t in self._tunnels if t.failures >= self._max_failures or not t.ssr.tunnel_alive]
+                self._tunnels = [t for t in self._tunnels if t not in evicted]
+            for tunnel in evicted:
+                cp.error('Evict {}, {} failures.'.format(tunnel, tunnel.failures))
+                tunnel.ssr.close_tunnel()
+
+            self.__fill()
+            self._refill.clear()
+
+    def __fill(self):
+        # each candidate once at most per round
+        attempts = 0
+        while len(self._tunnels) < self._size and not self._stopped.is_set():
+            url = next(self._candidates, None)
+            if url is None or attempts >= self._candidate_count:
+                return
+            attempts += 1
+
+            with self._lock:
+                if any(t.url == url for t in self._tunnels):
+                    continue
+
+            ssr = SSR(self._path_to_config, settings=self._settings)
+            ssr.url = url
+            try:
+                opened = ssr.open_tunnel()
+            except Exception as e:
+                cp.error(e)
+                ssr.close_tunnel()
+                continue
+
+            if opened:
+                with self._lock:
+                    self._tunnels.append(Tunnel(url, ssr))
@@ -0,0 +1,66 @@
+# coding:utf-8
+import csv
+import bisect
+import threading
+import ipaddress
+
+
+class GeoIPDatabase:
+    def __init__(self, path_to_csv: str):
+        # rows: start_ip, end_ip, country_code[, country], e.g. a db-ip.com "country lite" CSV
+        ranges = {4: list(), 6: list()}
+        with open(path_to_csv, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or row[0].startswith('#'):
+                    continue
+                try:
+                    start = ipaddress.ip_address(row[0].strip())
+                    end = ipaddress.ip_address(row[1].strip())
+                except ValueError:
+                    continue
+
+                country_code = row[2].strip() or None
+                country = row[3].strip() if len(row) > 3 and row[3].strip() else country_code
+                ranges[start.version].append((int(start), int(end), country_code, country))
+
+        # sorted starts, for bisect
+        self._starts = dict()
+        self._ranges = dict()
+        for version, items in ranges.items():
+            items.sort()
+            self._starts[version] = [item[0] for item in items]
+            self._ranges[version] = items
+
+    def __len__(self):
+        return sum(len(items) for items in self._ranges.values())
+
+    def lookup(self, ip: str):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        value = int(address)
+        i = bisect.bisect_right(self._starts[address.version], value) - 1
+        if i < 0:
+            return None
+
+        start, end, country_code, country = self._ranges[address.version][i]
+        if value > end:
+            return None
+        return {
+            'country_code': country_code,
+            'country': country,
+        }
+
+
+_lock = threading.Lock()
+_databases = dict()
+
+
+def get_database(path_to_csv: str):
+    # loaded once per process
+    with _lock:
+        if path_to_csv not in _databases:
+            _databases[path_to_csv] = GeoIPDatabase(path_to_csv)
+        return _databases[path_to_csv]
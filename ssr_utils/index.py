@@ -0,0 +1,90 @@
+# coding:utf-8
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+from .node import parse_url
+
+IndexDiff = namedtuple('IndexDiff', ['added', 'removed', 'changed'])
+
+
+class NodeIndex:
+    def __init__(self, path_to_db: str = os.path.join(tempfile.gettempdir(), 'ssr_utils_index.sqlite')):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path_to_db, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS nodes ('
+                           'source TEXT NOT NULL, '
+                           'fingerprint TEXT NOT NULL, '
+                           'url TEXT NOT NULL, '
+                           'remarks TEXT, '
+                           '"group" TEXT, '
+                           'first_seen REAL NOT NULL, '
+                           'last_seen REAL NOT NULL, '
+                           'present INTEGER NOT NULL DEFAULT 1, '
+                           'PRIMARY KEY (source, fingerprint))')
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def refresh(self, urls, source: str = ''):
+        now = time.time()
+
+        # current nodes, by fingerprint
+        current = dict()
+        for url in urls:
+            try:
+                node = parse_url(url)
+            except Exception:
+                continue
+            if node and node.is_valid:
+                current[node.fingerprint] = (url, node)
+
+        added, removed, changed = list(), list(), list()
+        with self._lock, self._conn:
+            known = {row[0]: row[1:] for row in self._conn.execute(
+                'SELECT fingerprint, url, remarks, "group", present FROM nodes WHERE source = ?', (source,))}
+
+            for key, (url, node) in current.items():
+                row = known.get(key)
+                if row is None:
+                    added.append(url)
+                    self._conn.execute('INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, 1)',
+                                       (source, key, url, node.remarks, node.group, now, now))
+                    continue
+
+                if not row[3]:
+                    added.append(url)
+                elif (row[1], row[2]) != (node.remarks, node.group):
+                    changed.append(url)
+
+                self._conn.execute('UPDATE nodes SET url = ?, remarks = ?, "group" = ?, last_seen = ?, present = 1 '
+                                   'WHERE source = ? AND fingerprint = ?',
+                                   (url, node.remarks, node.group, now, source, key))
+
+            for key, row in known.items():
+                if row[3] and key not in current:
+                    removed.append(row[0])
+                    self._conn.execute('UPDATE nodes SET present = 0 WHERE source = ? AND fingerprint = ?',
+                                       (source, key))
+
+        return IndexDiff(added=added, removed=removed, changed=changed)
+
+    def nodes(self, source: str = None, present: bool = True):
+        sql = 'SELECT source, fingerprint, url, remarks, "group", first_seen, last_seen FROM nodes WHERE present = ?'
+        args = [1 if present else 0]
+        if source is not None:
+            sql += ' AND source = ?'
+            args.append(source)
+
+        with self._lock:
+            return [dict(zip(('source', 'fingerprint', 'url', 'remarks', 'group', 'first_seen', 'last_seen'), row))
+                    for row in self._conn.execute(sql, args)]
@@ -0,0 +1,234 @@
+# coding:utf-8
+import os
+import select
+import socket
+import hashlib
+import threading
+from .net import socks5_reply
+from .net import socks5_accept
+from .output import cp
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+
+class _RC4:
+    # pure Python, slow, but a check moves a few KB
+    def __init__(self, key: bytes):
+        s = list(range(256))
+        j = 0
+        for i in range(256):
+            j = (j + s[i] + key[i % len(key)]) % 256
+            s[i], s[j] = s[j], s[i]
+        self._s = s
+        self._i = 0
+        self._j = 0
+
+    def update(self, data: bytes):
+        s, i, j = self._s, self._i, self._j
+        out = bytearray(len(data))
+        for n, c in enumerate(data):
+            i = (i + 1) % 256
+            j = (j + s[i]) % 256
+            s[i], s[j] = s[j], s[i]
+            out[n] = c ^ s[(s[i] + s[j]) % 256]
+        self._i, self._j = i, j
+        return bytes(out)
+
+
+def _rc4_md5(key: bytes, iv: bytes, encrypt: bool):
+    return _RC4(hashlib.md5(key + iv).digest())
+
+
+def _aes(mode):
+    def factory(key: bytes, iv: bytes, encrypt: bool):
+        cipher = Cipher(algorithms.AES(key), mode(iv), backend=default_backend())
+        return cipher.encryptor() if encrypt else cipher.decryptor()
+    return factory
+
+
+def _chacha20(key: bytes, iv: bytes, encrypt: bool):
+    # 32-bit counter and 96-bit nonce, the 64-bit nonce of `chacha20` is zero-padded the same way
+    cipher = Cipher(algorithms.ChaCha20(key, b'\x00' * (16 - len(iv)) + iv), mode=None, backend=default_backend())
+    return cipher.encryptor() if encrypt else cipher.decryptor()
+
+
+# method -> (key length, IV length, cipher factory)
+METHODS = {
+    'rc4-md5': (16, 16, _rc4_md5),
+}
+
+if Cipher is not None:
+    for _bits in (128, 192, 256):
+        METHODS['aes-{}-cfb'.format(_bits)] = (_bits // 8, 16, _aes(modes.CFB))
+        METHODS['aes-{}-cfb8'.format(_bits)] = (_bits // 8, 16, _aes(modes.CFB8))
+        METHODS['aes-{}-ctr'.format(_bits)] = (_bits // 8, 16, _aes(modes.CTR))
+    METHODS['chacha20'] = (32, 8, _chacha20)
+    METHODS['chacha20-ietf'] = (32, 12, _chacha20)
+
+
+def is_supported(node):
+    # SS stream ciphers, which is SSR with `origin` and `plain`
+    return (node.method or '').lower() in METHODS and \
+        (node.protocol or 'origin') == 'origin' and \
+        (node.obfs or 'plain') == 'plain'
+
+
+def evp_bytes_to_key(password: bytes, key_len: int):
+    # OpenSSL EVP_BytesToKey, MD5, one iteration, as shadowsocks does
+    key = b''
+    last = b''
+    while len(key) < key_len:
+        last = hashlib.md5(last + password).digest()
+        key += last
+    return key[:key_len]
+
+
+class Encryptor:
+    def __init__(self, method: str, password: str):
+        self._key_len, self._iv_len, self._factory = METHODS[method.lower()]
+        self._key = evp_bytes_to_key(password.encode('utf-8'), self._key_len)
+
+        self._encipher = None
+        self._decipher = None
+        self._pending = b''
+
+    def encrypt(self, data: bytes):
+        # the IV first
+        if self._encipher is None:
+            iv = os.urandom(self._iv_len)
+            self._encipher = self._factory(self._key, iv, True)
+            return iv + self._encipher.update(data)
+        return self._encipher.update(data)
+
+    def decrypt(self, data: bytes):
+        # the IV of the server may come in pieces
+        if self._decipher is None:
+            self._pending += data
+            if len(self._pending) < self._iv_len:
+                return b''
+            iv, data = self._pending[:self._iv_len], self._pending[self._iv_len:]
+            self._pending = b''
+            self._decipher = self._factory(self._key, iv, False)
+        return self._decipher.update(data) if data else b''
+
+
+def address_header(host: str, port: int):
+    try:
+        return b'\x01' + socket.inet_pton(socket.AF_INET, host) + port.to_bytes(2, 'big')
+    except OSError:
+        pass
+    try:
+        return b'\x04' + socket.inet_pton(socket.AF_INET6, host) + port.to_bytes(2, 'big')
+    except OSError:
+        pass
+    host_bytes = host.encode('idna')
+    return b'\x03' + bytes([len(host_bytes)]) + host_bytes + port.to_bytes(2, 'big')
+
+
+class LocalServer:
+    # SOCKS5 on `local_address:local_port`, SS to `server:port`, in threads of this process
+    def __init__(self,
+                 server: str,
+                 port: int,
+                 method: str,
+                 password: str,
+                 local_address: str = '127.0.0.1',
+                 local_port: int = 1080,
+                 timeout: float = 10,
+                 ):
+        self._server = server
+        self._port = int(port)
+        self._method = method
+        self._password = password
+        self._timeout = timeout
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((local_address, local_port))
+        self._sock.listen(16)
+
+        self._stopped = threading.Event()
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.__serve, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        # wakes `accept` up, `close` alone does not
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        with self._lock:
+            for conn in list(self._connections):
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self._thread.join(1)
+
+    def __serve(self):
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.__handle, args=(client,), daemon=True).start()
+
+    def __handle(self, client: socket.socket):
+        remote = None
+        with self._lock:
+            self._connections.add(client)
+        try:
+            client.settimeout(self._timeout)
+            host, port = socks5_accept(client)
+
+            remote = socket.create_connection((self._server, self._port), timeout=self._timeout)
+            with self._lock:
+                self._connections.add(remote)
+            encryptor = Encryptor(self._method, self._password)
+            remote.sendall(encryptor.encrypt(address_header(host, port)))
+            client.sendall(socks5_reply())
+
+            self.__relay(client, remote, encryptor)
+        except (OSError, ValueError, IndexError) as e:
+            cp.error(e)
+        finally:
+            for s in (client, remote):
+                if s:
+                    s.close()
+                    with self._lock:
+                        self._connections.discard(s)
+
+    def __relay(self, client: socket.socket, remote: socket.socket, encryptor: Encryptor):
+        sockets = [client, remote]
+        while not self._stopped.is_set():
+            readable, _, _ = select.select(sockets, [], [], self._timeout)
+            if not readable:
+                return
+            for s in readable:
+                data = s.recv(65536)
+                if not data:
+                    return
+                if s is client:
+                    remote.sendall(encryptor.encrypt(data))
+                else:
+                    data = encryptor.decrypt(data)
+                    if data:
+                        client.sendall(data)
@@ -0,0 +1,114 @@
+# coding:utf-8
+import time
+import json
+import threading
+from contextlib import contextmanager
+from .output import cp
+
+
+class Metrics:
+    def __init__(self, prefix: str = 'ssr_utils'):
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._hooks = list()
+        self._counters = dict()
+        self._spans = dict()
+
+    def add_hook(self, hook):
+        # hook(event: dict), called for every span and counter
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._spans.clear()
+
+    def count(self, name: str, value: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self.__emit({'type': 'counter', 'name': name, 'value': value, 'labels': labels})
+
+    @contextmanager
+    def span(self, phase: str, **labels):
+        start = time.time()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.time() - start
+            with self._lock:
+                item = self._spans.setdefault(phase, [0, 0.0, 0.0])
+                item[0] += 1
+                item[1] += duration
+                item[2] = max(item[2], duration)
+            self.__emit({
+                'type': 'span',
+                'phase': phase,
+                'start': start,
+                'duration': duration,
+                'error': error,
+                'labels': labels,
+            })
+
+    def __emit(self, event: dict):
+        with self._lock:
+            hooks = list(self._hooks)
+        for hook in hooks:
+            # a broken exporter never fails a check
+            try:
+                hook(event)
+            except Exception as e:
+                cp.error('[metrics] hook {}: {}'.format(getattr(hook, '__name__', hook), e))
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self._counters.items())],
+                'spans': {phase: {'count': item[0], 'sum': item[1], 'max': item[2]}
+                          for phase, item in sorted(self._spans.items())},
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        lines = list()
+
+        names = list()
+        for counter in data['counters']:
+            name = '{}_{}'.format(self._prefix, counter['name'])
+            if name not in names:
+                names.append(name)
+                lines.append('# TYPE {} counter'.format(name))
+            lines.append('{}{} {}'.format(name, _labels(counter['labels']), counter['value']))
+
+        if data['spans']:
+            name = '{}_phase_seconds'.format(self._prefix)
+            lines.append('# TYPE {} summary'.format(name))
+            for phase, item in data['spans'].items():
+                labels = _labels({'phase': phase})
+                lines.append('{}_sum{} {}'.format(name, labels, item['sum']))
+                lines.append('{}_count{} {}'.format(name, labels, item['count']))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: dict):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in sorted(labels.items())) + '}'
+
+
+default_metrics = Metrics()
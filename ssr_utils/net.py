@@ -0,0 +1,82 @@
+# coding:utf-8
+import socket
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) ' \
+             'AppleWebKit/537.36 (KHTML, like Gecko) ' \
+             'Chrome/71.0.3578.80 ' \
+             'Safari/537.36'
+
+# no authentication
+SOCKS5_GREETING = b'\x05\x01\x00'
+SOCKS5_NO_AUTH = b'\x05\x00'
+
+
+def socks5_request(host: str, port: int):
+    # CONNECT by domain name
+    host_bytes = host.encode('idna')
+    return b'\x05\x01\x00\x03' + bytes([len(host_bytes)]) + host_bytes + port.to_bytes(2, 'big')
+
+
+def socks5_reply(code: int = 0):
+    # 0 succeeded, 1 general failure, 7 command not supported, bound to 0.0.0.0:0
+    return b'\x05' + bytes([code]) + b'\x00\x01\x00\x00\x00\x00\x00\x00'
+
+
+def socks5_check_reply(reply: bytes, host: str, port: int):
+    # size of the bound address and port left to read, `None` for a domain, its length byte first
+    if reply[1] != 0:
+        raise ConnectionError('SOCKS5 CONNECT to {}:{} failed, code {}'.format(host, port, reply[1]))
+    return {1: 4 + 2, 4: 16 + 2}.get(reply[3])
+
+
+def socks5_socket(proxy_host: str, proxy_port: int, host: str, port: int, timeout: float = 10):
+    sock = socket.create_connection((proxy_host, proxy_port), timeout=timeout)
+    try:
+        sock.sendall(SOCKS5_GREETING)
+        if _recv_exactly(sock, 2) != SOCKS5_NO_AUTH:
+            raise ConnectionError('SOCKS5 handshake refused by {}:{}'.format(proxy_host, proxy_port))
+
+        sock.sendall(socks5_request(host, port))
+        size = socks5_check_reply(_recv_exactly(sock, 4), host, port)
+        if size is None:
+            size = _recv_exactly(sock, 1)[0] + 2
+        _recv_exactly(sock, size)
+
+        return sock
+
+    except BaseException:
+        sock.close()
+        raise
+
+
+def socks5_accept(client):
+    # the server side, no authentication, CONNECT only, (host, port) of the request
+    head = _recv_exactly(client, 2)
+    _recv_exactly(client, head[1])
+    if head[0] != 5:
+        raise ValueError('Not SOCKS5')
+    client.sendall(SOCKS5_NO_AUTH)
+
+    request = _recv_exactly(client, 4)
+    if request[1] != 1:
+        client.sendall(socks5_reply(7))
+        raise ValueError('Not CONNECT')
+
+    if request[3] == 1:
+        host = socket.inet_ntop(socket.AF_INET, _recv_exactly(client, 4))
+    elif request[3] == 4:
+        host = socket.inet_ntop(socket.AF_INET6, _recv_exactly(client, 16))
+    else:
+        host = _recv_exactly(client, _recv_exactly(client, 1)[0]).decode('idna')
+    port = int.from_bytes(_recv_exactly(client, 2), 'big')
+    return host, port
+
+
+def _recv_exactly(sock, n: int):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed by the proxy')
+        data += chunk
+    return data
@@ -0,0 +1,276 @@
+# coding:utf-8
+import os
+import json
+import binascii
+import hashlib
+import functools
+import urllib.parse
+from qwert import base64
+from .resolver import default_resolver
+
+
+class Node:
+    __slots__ = (
+        'server',
+        'port',
+        'method',
+        'password',
+        'protocol',
+        'proto_param',
+        'obfs',
+        'obfs_param',
+
+        'remarks',
+        'group',
+    )
+
+    def __init__(self,
+                 server: str = '',
+                 port: int = 443,
+                 method: str = '',
+                 password: str = '',
+                 protocol: str = 'origin',
+                 proto_param: str = None,
+                 obfs: str = 'plain',
+                 obfs_param: str = None,
+
+                 remarks: str = None,
+                 group: str = None,
+                 ):
+        self.server = server
+        self.port = port
+        self.method = method
+        self.password = password
+        self.protocol = protocol
+        self.proto_param = proto_param
+        self.obfs = obfs
+        self.obfs_param = obfs_param
+
+        self.remarks = remarks
+        self.group = group
+
+    def __repr__(self):
+        return '<Node {}:{} {}/{}/{}>'.format(self.server, self.port, self.method, self.protocol, self.obfs)
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    @property
+    def is_valid(self):
+        return all([self.server, self.port, self.method, self.password, self.protocol, self.obfs])
+
+    @property
+    def fingerprint(self):
+        return fingerprint(self)
+
+
+def fingerprint(node, server: str = None):
+    # what makes a connection, works for `Node` and `SSR`, remarks and group excluded
+    return hashlib.sha1('\n'.join([
+        (server or node.server or '').lower(),
+        str(node.port),
+        node.method or '',
+        node.password or '',
+        node.protocol or '',
+        node.proto_param or '',
+        node.obfs or '',
+        node.obfs_param or '',
+    ]).encode('utf-8')).hexdigest()
+
+
+def encode_url(node):
+    return _encode_url(node.server,
+                       node.port,
+                       node.protocol,
+                       node.method,
+                       node.obfs,
+                       node.password,
+                       node.proto_param or '',
+                       node.obfs_param or '',
+                       node.remarks or '',
+                       node.group or '',
+                       )
+
+
+@functools.lru_cache(maxsize=4096)
+def _encode_url(server, port, protocol, method, obfs, password, proto_param, obfs_param, remarks, group):
+    prefix = '{server}:{port}:{protocol}:{method}:{obfs}:{password}'.format(
+        server=server,
+        port=port,
+        protocol=protocol,
+        method=method,
+        obfs=obfs,
+        password=base64.encode(password, urlsafe=True))
+
+    suffix_list = []
+    if proto_param:
+        suffix_list.append('protoparam={}'.format(base64.encode(proto_param, urlsafe=True)))
+
+    if obfs_param:
+        suffix_list.append('obfsparam={}'.format(base64.encode(obfs_param, urlsafe=True)))
+
+    suffix_list.append('remarks={}'.format(base64.encode(remarks, urlsafe=True)))
+    suffix_list.append('group={}'.format(base64.encode(group, urlsafe=True)))
+
+    return 'ssr://{}'.format(base64.encode('{prefix}/?{suffix}'.format(
+        prefix=prefix,
+        suffix='&'.join(suffix_list),
+    ), urlsafe=True))
+
+
+def iter_subscription(nodes, chunk_size: int = 65536):
+    # base64 of the URLs, one per line, the inverse of `get_urls_by_base64`, in blocks of 3 bytes
+    pending = b''
+    first = True
+    for node in nodes:
+        url = node if isinstance(node, str) else encode_url(node)
+        pending += ('' if first else '\n').encode('utf-8') + url.encode('utf-8')
+        first = False
+
+        if len(pending) >= chunk_size:
+            size = len(pending) - len(pending) % 3
+            yield binascii.b2a_base64(pending[:size], newline=False).decode('ascii')
+            pending = pending[size:]
+
+    if pending:
+        yield binascii.b2a_base64(pending, newline=False).decode('ascii')
+
+
+def write_subscription(nodes, f, chunk_size: int = 65536):
+    for chunk in iter_subscription(nodes, chunk_size=chunk_size):
+        f.write(chunk)
+
+
+def config_json(node, server: str = None, local_address: str = '127.0.0.1', local_port: int = 1080):
+    # `server` overrides `node.server`, e.g. by IP
+    return _config_json(server or node.server,
+                        node.port,
+                        node.method or '',
+                        node.password or '',
+                        node.protocol or '',
+                        node.proto_param or '',
+                        node.obfs or '',
+                        node.obfs_param or '',
+                        local_address,
+                        local_port,
+                        )
+
+
+@functools.lru_cache(maxsize=4096)
+def _config_json(server, port, method, password, protocol, proto_param, obfs, obfs_param, local_address, local_port):
+    return json.dumps({
+        'server': server,
+        'server_port': int(port),
+        'method': method,
+        'password': password,
+        'protocol': protocol,
+        'protocol_param': proto_param,
+        'obfs': obfs,
+        'obfs_param': obfs_param,
+        'local_address': local_address,
+        'local_port': int(local_port),
+    }, indent=4, ensure_ascii=False)
+
+
+def export_configs(nodes, path_to_dir: str, by_ip: bool = False, local_address: str = '127.0.0.1',
+                   local_port: int = 1080):
+    # one <fingerprint>.json per node, a list of (node, path)
+    nodes = list(nodes)
+    os.makedirs(path_to_dir, exist_ok=True)
+
+    ips = dict()
+    if by_ip:
+        ips = default_resolver.resolve_many([node.server for node in nodes])
+
+    result = list()
+    for node in nodes:
+        server = None
+        if by_ip:
+            server = (ips.get(node.server) or [node.server])[0]
+
+        path_to_file = os.path.join(path_to_dir, '{}.json'.format(fingerprint(node)))
+        with open(path_to_file, 'w', encoding='utf-8') as f:
+            f.write(config_json(node, server=server, local_address=local_address, local_port=local_port))
+        result.append((node, path_to_file))
+    return result
+
+
+def parse_ssr(ssr_base64: str):
+    ssr = ssr_base64.split('#')[0]
+    ssr = base64.decode(ssr)
+
+    if isinstance(ssr, bytes):
+        return None
+
+    ssr_list = ssr.split(':')
+    password_and_params = ssr_list[5].split('/?')
+
+    node = Node(server=ssr_list[0],
+                port=int(ssr_list[1]),
+                protocol=ssr_list[2],
+                method=ssr_list[3],
+                obfs=ssr_list[4],
+                password=base64.decode(password_and_params[0]),
+                )
+
+    params_dict = dict()
+    for param in password_and_params[1].split('&'):
+        param_list = param.split('=')
+        params_dict[param_list[0]] = base64.decode(param_list[1])
+
+    for key in ['proto_param', 'obfs_param', 'remarks', 'group']:
+        tmp_key = key.replace('_', '')
+        if tmp_key in params_dict:
+            setattr(node, key, params_dict[tmp_key])
+
+    return node
+
+
+def parse_ss(ss_base64: str):
+    ss = ss_base64.split('#')
+    remarks = None
+    if len(ss) > 1:
+        remarks = urllib.parse.unquote(ss[1])
+    ss = base64.decode(ss[0])
+
+    if isinstance(ss, bytes):
+        return None
+
+    # use split and join, in case of the password contains "@"/":"
+    str_list = ss.split('@')
+
+    server_and_port = str_list[-1].split(':')
+    method_and_pass = '@'.join(str_list[0:-1]).split(':')
+
+    return Node(server=server_and_port[0],
+                port=int(server_and_port[1]),
+                method=method_and_pass[0],
+                password=':'.join(method_and_pass[1:]),
+                remarks=remarks,
+                )
+
+
+def parse_url(url: str):
+    r = url.strip().split('://', 1)
+    if len(r) < 2:
+        return None
+
+    if r[0] == 'ssr':
+        return parse_ssr(r[1])
+    elif r[0] == 'ss':
+        return parse_ss(r[1])
+    return None
+
+
+def parse_urls(urls):
+    # skip what can not be parsed, one bad line should not stop a list of thousands
+    for url in urls:
+        try:
+            node = parse_url(url)
+        except Exception:
+            continue
+
+        if node and node.is_valid:
+            yield node
@@ -0,0 +1,23 @@
+# coding:utf-8
+import cli_print
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+class _Output:
+    # `cli_print`, or nothing at all in silent mode
+    silent = False
+
+    def __getattr__(self, name):
+        if self.silent and callable(getattr(cli_print, name)) and not name[0].isupper():
+            return _noop
+        return getattr(cli_print, name)
+
+
+cp = _Output()
+
+
+def set_silent(silent: bool = True):
+    cp.silent = silent
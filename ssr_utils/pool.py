@@ -0,0 +1,235 @@
+# coding:utf-8
+import os
+import time
+import signal
+import threading
+import subprocess
+import collections
+from .ports import PortLease
+from .ports import PortAllocator
+from .ports import get_port_allocator
+from .settings import get_settings
+from .output import cp
+
+# A long-lived interpreter, shadowsocks modules imported once,
+# forks a fresh `local.py` for each config path, or one-line JSON config, read from stdin, and prints the child PID.
+BOOTSTRAP = r'''
+import os
+import sys
+import runpy
+import signal
+
+path_to_python_ssr = os.path.abspath(sys.argv[1])
+sys.path.insert(0, os.path.join(os.path.dirname(path_to_python_ssr), '../'))
+try:
+    from shadowsocks import shell, daemon, eventloop, tcprelay, udprelay, asyncdns
+except ImportError:
+    pass
+
+signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+
+    # the child closes `w` after setsid, so its PID is also its group ID once we reply
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.setsid()
+        os.close(r)
+        os.close(w)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+
+        # JSON config, through a pipe, never on disk
+        path_to_config = line.strip()
+        if path_to_config.startswith('{'):
+            config_r, config_w = os.pipe()
+            os.write(config_w, path_to_config.encode('utf-8'))
+            os.close(config_w)
+            path_to_config = '/dev/fd/{}'.format(config_r)
+
+        sys.argv = [path_to_python_ssr, '-c', path_to_config]
+        try:
+            runpy.run_path(path_to_python_ssr, run_name='__main__')
+        finally:
+            os._exit(0)
+
+    os.close(w)
+    os.read(r, 1)
+    os.close(r)
+
+    sys.stdout.write('{}\n'.format(pid))
+    sys.stdout.flush()
+'''
+
+
+class ForkedProgress:
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        # not our child, the pool worker reaps it
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                self.returncode = -1
+        return self.returncode
+
+    def wait(self, timeout: float = 5):
+        # until the pool worker reaped it, so the port is free for the next one
+        deadline = time.time() + timeout
+        while self.poll() is None and time.time() < deadline:
+            time.sleep(0.01)
+        return self.returncode
+
+
+class PoolWorker:
+    def __init__(self, lease: PortLease):
+        self.lease = lease
+        self.port = lease.port
+        self.uses = 0
+        self.failures = 0
+        self._process = None
+        self._cmd_key = None
+
+    @property
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self, cmd_prefix: str, path_to_python_ssr: str, path_to_ssr_conf: str = None, config_json: str = None):
+        # (re)spawn, if dead or launched by another command, e.g. a new proxychains config
+        cmd_key = (cmd_prefix, path_to_python_ssr)
+        if not self.is_alive or self._cmd_key != cmd_key:
+            self.close()
+            self._process = subprocess.Popen(
+                cmd_prefix.split() + ['-c', BOOTSTRAP, path_to_python_ssr],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+                preexec_fn=os.setsid,
+            )
+            self._cmd_key = cmd_key
+
+        try:
+            if config_json:
+                self._process.stdin.write(' '.join(config_json.splitlines()) + '\n')
+            else:
+                self._process.stdin.write(path_to_ssr_conf + '\n')
+            self._process.stdin.flush()
+            pid = int(self._process.stdout.readline())
+        except (OSError, ValueError):
+            self.failures += 1
+            self.close()
+            raise ChildProcessError('Pool worker on port {} did not start SSR.'.format(self.port))
+
+        self.uses += 1
+        self.failures = 0
+        return ForkedProgress(pid)
+
+    def close(self):
+        if self._process:
+            try:
+                os.killpg(os.getpgid(self._process.pid), signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._process.wait()
+            self._process = None
+            self._cmd_key = None
+
+
+class SSRProcessPool:
+    def __init__(self,
+                 size: int = 4,
+                 local_port: int = None,
+                 max_uses: int = 200,
+                 max_failures: int = 3,
+                 allocator: PortAllocator = None,
+                 settings=None,
+                 ):
+        self._max_uses = max_uses
+        self._max_failures = max_failures
+
+        # a port leased per worker for its lifetime, from `local_port` on, or from the shared range
+        if allocator is None:
+            if local_port:
+                allocator = PortAllocator(port_min=local_port, port_max=local_port + size - 1)
+            else:
+                allocator = get_port_allocator(settings or get_settings())
+        leases = list()
+        for _ in range(0, size):
+            lease = allocator.try_acquire()
+            if lease is None:
+                cp.error('Only {} of {} ports free for the pool.'.format(len(leases), size))
+                break
+            leases.append(lease)
+
+        # the live workers, and those of them idle, waiters are woken on release and on retirement
+        self._available = threading.Condition()
+        self._workers = [PoolWorker(lease) for lease in leases]
+        self._idle = collections.deque(self._workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def size(self):
+        return len(self._workers)
+
+    @property
+    def health(self):
+        return [{
+            'port': worker.port,
+            'alive': worker.is_alive,
+            'uses': worker.uses,
+            'failures': worker.failures,
+        } for worker in self._workers]
+
+    def acquire(self, timeout: float = None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._available:
+            while not self._idle:
+                if not self._workers:
+                    raise ChildProcessError('No healthy worker left in the pool.')
+
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise ChildProcessError('No idle worker in the pool within {}s.'.format(timeout))
+                self._available.wait(remaining)
+            return self._idle.popleft()
+
+    def release(self, worker: PoolWorker):
+        # retire
+        if worker.failures >= self._max_failures:
+            cp.error('Pool worker on port {} retired after {} failures.'.format(worker.port, worker.failures))
+            worker.close()
+            worker.lease.release()
+            with self._available:
+                self._workers.remove(worker)
+                # the last one, nobody would ever wake them otherwise
+                self._available.notify_all()
+            return
+
+        # recycle
+        if worker.uses >= self._max_uses:
+            worker.close()
+            worker.uses = 0
+
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
+            worker.lease.release()
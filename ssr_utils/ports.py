@@ -0,0 +1,138 @@
+# coding:utf-8
+import os
+import time
+import fcntl
+import socket
+import tempfile
+import threading
+
+
+class PortLease:
+    def __init__(self, allocator, port: int, fd: int):
+        self.port = port
+        self._allocator = allocator
+        self._fd = fd
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __repr__(self):
+        return '<PortLease {}>'.format(self.port)
+
+    @property
+    def released(self):
+        return self._fd is None
+
+    def release(self):
+        if self._fd is not None:
+            self._allocator._release(self.port, self._fd)
+            self._fd = None
+
+
+class PortAllocator:
+    def __init__(self,
+                 port_min: int = 13431,
+                 port_max: int = 13630,
+                 host: str = '127.0.0.1',
+                 path_to_lock_dir: str = None,
+                 ):
+        if port_max < port_min:
+            raise ValueError('Empty port range {}-{}.'.format(port_min, port_max))
+
+        self._port_min = port_min
+        self._port_max = port_max
+        self._host = host
+        self._path_to_lock_dir = path_to_lock_dir or os.path.join(tempfile.gettempdir(), 'ssr_utils_ports')
+        os.makedirs(self._path_to_lock_dir, exist_ok=True)
+
+        # leased by this process, other processes hold the lock files
+        self._lock = threading.Lock()
+        self._leased = set()
+        self._cursor = port_min
+
+    @property
+    def size(self):
+        return self._port_max - self._port_min + 1
+
+    @property
+    def leased(self):
+        with self._lock:
+            return sorted(self._leased)
+
+    def acquire(self, timeout: float = None):
+        # the next free port of the range, wait for one if all are leased
+        deadline = None if timeout is None else time.time() + timeout
+        delay = 0.05
+        while True:
+            lease = self.try_acquire()
+            if lease:
+                return lease
+
+            if deadline is not None and time.time() >= deadline:
+                raise TimeoutError('No free port in {}-{}.'.format(self._port_min, self._port_max))
+
+            time.sleep(delay if deadline is None else min(delay, max(deadline - time.time(), 0)))
+            delay = min(delay * 2, 0.5)
+
+    def try_acquire(self):
+        for _ in range(0, self.size):
+            with self._lock:
+                port = self._cursor
+                self._cursor = port + 1 if port < self._port_max else self._port_min
+                if port in self._leased:
+                    continue
+                self._leased.add(port)
+
+            fd = self.__lock_port(port)
+            if fd is not None:
+                if self.is_bindable(port, host=self._host):
+                    return PortLease(self, port, fd)
+                os.close(fd)
+
+            with self._lock:
+                self._leased.discard(port)
+
+        return None
+
+    def _release(self, port: int, fd: int):
+        # closing the file drops the lock, the kernel does it as well if the process crashed
+        os.close(fd)
+        with self._lock:
+            self._leased.discard(port)
+
+    def __lock_port(self, port: int):
+        fd = os.open(os.path.join(self._path_to_lock_dir, '{}.lock'.format(port)), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def is_bindable(port: int, host: str = '127.0.0.1'):
+        # SSR sets SO_REUSEADDR as well, a port in TIME_WAIT is fine
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                s.bind((host, port))
+                return True
+            except OSError:
+                return False
+
+
+_lock = threading.Lock()
+_allocators = dict()
+
+
+def get_port_allocator(settings):
+    # one per port range, shared by all checks in the process
+    port_min = int(settings['ssr_utils.local_port'])
+    port_max = port_min + max(int(settings['ssr_utils.port_range']), 1) - 1
+    with _lock:
+        if (port_min, port_max) not in _allocators:
+            _allocators[(port_min, port_max)] = PortAllocator(port_min=port_min, port_max=port_max)
+        return _allocators[(port_min, port_max)]
@@ -0,0 +1,187 @@
+# coding:utf-8
+import os
+import json
+import time
+import tempfile
+import threading
+import proxy_fn
+import ip_query
+import proxychains_conf_generator
+from concurrent import futures
+from qwert import list_fn
+from qwert import file_fn
+from .errors import *
+from .output import cp
+
+
+class PreProxyManager:
+    def __init__(self,
+                 path_to_pre_proxy: str = 'pre_proxy.txt',
+                 path_to_pc4_conf_file: str = os.path.join(tempfile.gettempdir(), 'ssr_utils_pc4.conf'),
+                 path_to_health: str = os.path.join(tempfile.gettempdir(), 'ssr_utils_pre_proxy.json'),
+                 cache_time: float = 300,
+                 refresh_ratio: float = 0.8,
+                 max_proxies: int = 3,
+                 workers: int = 16,
+                 lookup=ip_query.ip_query,
+                 ):
+        self._path_to_pre_proxy = path_to_pre_proxy
+        self._path_to_pc4_conf_file = path_to_pc4_conf_file
+        self._path_to_health = path_to_health
+        self._cache_time = cache_time
+        self._refresh_ratio = refresh_ratio
+        self._max_proxies = max_proxies
+        self._workers = workers
+        self._lookup = lookup
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = None
+        self._health = self.__load_health()
+
+    @property
+    def health(self):
+        with self._lock:
+            return dict(self._health)
+
+    @property
+    def healthy(self):
+        # the last probe ok, fewer recent failures and lower latency first
+        with self._lock:
+            items = [(line, item) for line, item in self._health.items() if item['ok']]
+        items.sort(key=lambda x: (x[1]['failures'], x[1]['latency']))
+        return [line for line, _ in items]
+
+    @property
+    def pc4_conf_file(self):
+        if not os.path.exists(self._path_to_pre_proxy):
+            return None
+
+        age = self.__refresh_age()
+        if age is None or age >= self._cache_time:
+            # nothing usable, wait for it, once for all threads
+            with self._refresh_lock:
+                age = self.__refresh_age()
+                if age is None or age >= self._cache_time:
+                    self.__refresh()
+        elif age >= self._cache_time * self._refresh_ratio:
+            # still good, renew it in the background
+            self.refresh_in_background()
+
+        if os.path.exists(self._path_to_pc4_conf_file):
+            return self._path_to_pc4_conf_file
+
+        raise NoAvailablePreProxy('No available proxy in "{}". Remove it if do not need a proxy.'.format(
+            self._path_to_pre_proxy,
+        ))
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing and self._refreshing.is_alive():
+                return
+            self._refreshing = threading.Thread(target=self.refresh, daemon=True)
+            self._refreshing.start()
+
+    def refresh(self):
+        with self._refresh_lock:
+            return self.__refresh()
+
+    def __refresh(self):
+        lines = file_fn.read_to_list(self._path_to_pre_proxy)
+        lines = list_fn.unique(lines) if lines else list()
+
+        with futures.ThreadPoolExecutor(max_workers=self._workers) as executor:
+            results = dict(zip(lines, executor.map(self.__probe, lines)))
+
+        with self._lock:
+            health = dict()
+            for line, latency in results.items():
+                item = self._health.get(line, {'failures': 0, 'last_ok': None})
+                if latency is None:
+                    item['failures'] += 1
+                else:
+                    item['failures'] = max(item['failures'] - 1, 0)
+                    item['last_ok'] = time.time()
+                    item['latency'] = latency
+                item['ok'] = latency is not None
+                item.setdefault('latency', float('inf'))
+                item['last_check'] = time.time()
+                health[line] = item
+            self._health = health
+            self.__save_health()
+
+        healthy = self.healthy
+        if not healthy:
+            cp.error('No available proxy in "{}".'.format(self._path_to_pre_proxy))
+            if os.path.exists(self._path_to_pc4_conf_file):
+                os.remove(self._path_to_pc4_conf_file)
+            return None
+
+        # several proxies, one at random per connection
+        path_to_tmp = '{}.{}.tmp'.format(self._path_to_pc4_conf_file, os.getpid())
+        g = proxychains_conf_generator.Generator(
+            proxy=healthy[:self._max_proxies],
+            chain_mode='random_chain',
+            quiet_mode=True,
+        )
+        g.write(path_to_conf=path_to_tmp)
+        os.replace(path_to_tmp, self._path_to_pc4_conf_file)
+        return self._path_to_pc4_conf_file
+
+    def __probe(self, line: str):
+        start = time.time()
+        try:
+            if self._lookup(requests_proxies=proxy_fn.line2requests_proxies(line)):
+                return time.time() - start
+        except Exception as e:
+            cp.error(e)
+        return None
+
+    def __age(self):
+        if os.path.exists(self._path_to_pc4_conf_file):
+            return time.time() - os.stat(self._path_to_pc4_conf_file).st_mtime
+        return None
+
+    def __refresh_age(self):
+        # of the config, or of the last refresh that found none healthy, not retried before `cache_time`
+        age = self.__age()
+        if age is not None:
+            return age
+
+        with self._lock:
+            if not self._health or any(item['ok'] for item in self._health.values()):
+                return None
+            last_check = max(item.get('last_check') or 0 for item in self._health.values())
+        return time.time() - last_check
+
+    def __load_health(self):
+        if os.path.exists(self._path_to_health):
+            try:
+                with open(self._path_to_health, 'r') as f:
+                    return json.load(f)
+            except ValueError:
+                pass
+        return dict()
+
+    def __save_health(self):
+        path_to_tmp = '{}.{}.tmp'.format(self._path_to_health, os.getpid())
+        with open(path_to_tmp, 'w') as f:
+            json.dump(self._health, f)
+        os.replace(path_to_tmp, self._path_to_health)
+
+
+_lock = threading.Lock()
+_managers = dict()
+
+
+def get_pre_proxy_manager(settings, lookup=ip_query.ip_query):
+    # one per pre-proxy file, shared by all checks in the process
+    path_to_pre_proxy = settings['ssr_utils.path_to_pre_proxy']
+    with _lock:
+        if path_to_pre_proxy not in _managers:
+            _managers[path_to_pre_proxy] = PreProxyManager(
+                path_to_pre_proxy=path_to_pre_proxy,
+                cache_time=settings['ssr_utils.proxychains4_cache_time'],
+                lookup=lookup,
+            )
+        return _managers[path_to_pre_proxy]
@@ -0,0 +1,96 @@
+# coding:utf-8
+import os
+import time
+import socket
+import threading
+from concurrent import futures
+from .resolver import default_resolver
+
+
+class Prescreen:
+    # a raw TCP connect to `server:port`, once per endpoint, before any SSR is spawned
+    def __init__(self,
+                 timeout: float = 2,
+                 ttl: float = 60,
+                 workers: int = 128,
+                 ):
+        self._timeout = timeout
+        self._ttl = ttl
+
+        self._lock = threading.Lock()
+        self._cache = dict()
+        self._in_flight = dict()
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers)
+
+    def cached(self, host: str, port: int):
+        with self._lock:
+            item = self._cache.get((host, int(port)))
+            if item and item[0] > time.time():
+                return item[1]
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def submit(self, host: str, port: int):
+        key = (host, int(port))
+        with self._lock:
+            item = self._cache.get(key)
+            if item and item[0] > time.time():
+                future = futures.Future()
+                future.set_result(item[1])
+                return future
+
+            # share the connect, if the same endpoint is being tested
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self.__test, key)
+                self._in_flight[key] = future
+            return future
+
+    def __test(self, key: tuple):
+        reachable = self.connect(key[0], key[1], timeout=self._timeout)
+        with self._lock:
+            self._cache[key] = (time.time() + self._ttl, reachable)
+            self._in_flight.pop(key, None)
+        return reachable
+
+    @staticmethod
+    def connect(host: str, port: int, timeout: float = 2):
+        # the first address, IPv4 first, like SSR by IP
+        ips = default_resolver.resolve(host)
+        if not ips:
+            return False
+
+        try:
+            with socket.create_connection((ips[0], int(port)), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def is_reachable(self, host: str, port: int):
+        return self.submit(host, port).result()
+
+    def reachable_many(self, endpoints):
+        # {(host, port): bool}, all at once
+        jobs = {(host, int(port)): self.submit(host, port) for host, port in endpoints}
+        return {key: future.result() for key, future in jobs.items()}
+
+
+_lock = threading.Lock()
+_screens = dict()
+
+
+def get_prescreen(settings):
+    # one per timeout, shared by all checks in the process
+    timeout = settings['ssr_utils.prescreen_timeout']
+    with _lock:
+        if timeout not in _screens:
+            _screens[timeout] = Prescreen(timeout=timeout)
+        return _screens[timeout]
+
+
+def use_prescreen(settings):
+    # through a pre-proxy, a direct connect says nothing
+    return bool(settings['ssr_utils.prescreen']) and not os.path.exists(settings['ssr_utils.path_to_pre_proxy'])
@@ -0,0 +1,73 @@
+# coding:utf-8
+import time
+import json
+import requests
+import ip_query
+from .geoip import get_database
+from .output import cp
+
+# 204, no body
+DEFAULT_PROBE_URL = 'http://www.gstatic.com/generate_204'
+
+
+class ConnectivityProbe:
+    def __init__(self,
+                 url: str = DEFAULT_PROBE_URL,
+                 ip_url: str = None,
+                 path_to_geoip_csv: str = None,
+                 timeout: float = ip_query.TIMEOUT,
+                 ):
+        self._url = url
+        self._ip_url = ip_url
+        self._path_to_geoip_csv = path_to_geoip_csv
+        self._timeout = timeout
+
+    def __call__(self, requests_proxies: dict = None):
+        # alive?
+        start = time.time()
+        try:
+            resp = requests.get(self._url, proxies=requests_proxies, timeout=self._timeout)
+        except requests.RequestException as e:
+            cp.error('[probe] {}'.format(e))
+            return None
+
+        if resp.status_code >= 400:
+            cp.error('[probe] status: {}'.format(resp.status_code))
+            return None
+
+        ip = ip_query.IP_DICT.copy()
+        ip['latency'] = time.time() - start
+
+        # where does it exit, optional
+        if self._ip_url:
+            ip['ip'] = self.__exit_ip(requests_proxies)
+
+        if ip['ip'] and self._path_to_geoip_csv:
+            geo = get_database(self._path_to_geoip_csv).lookup(ip['ip'])
+            if geo:
+                ip.update(geo)
+
+        return ip
+
+    def __exit_ip(self, requests_proxies: dict = None):
+        # plain text, or JSON with an "ip"
+        try:
+            resp = requests.get(self._ip_url, proxies=requests_proxies, timeout=self._timeout)
+            if resp.status_code == 200:
+                text = resp.content.decode('utf-8', errors='ignore').strip()
+                if text.startswith('{'):
+                    return json.loads(text).get('ip')
+                return text
+        except (requests.RequestException, ValueError) as e:
+            cp.error('[probe] {}'.format(e))
+        return None
+
+
+def get_exit_ip_lookup(settings):
+    # the probe, when configured, else the full `ip_query`
+    if settings['ssr_utils.probe_url']:
+        return ConnectivityProbe(url=settings['ssr_utils.probe_url'],
+                                 ip_url=settings['ssr_utils.exit_ip_url'] or None,
+                                 path_to_geoip_csv=settings['ssr_utils.path_to_geoip_csv'] or None,
+                                 )
+    return ip_query.ip_query
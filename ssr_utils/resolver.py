@@ -0,0 +1,111 @@
+# coding:utf-8
+import time
+import socket
+import threading
+import common_patterns
+from concurrent import futures
+
+
+class Resolver:
+    def __init__(self,
+                 ttl: float = 300,
+                 negative_ttl: float = 30,
+                 timeout: float = 5,
+                 workers: int = 16,
+                 ):
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._timeout = timeout
+
+        self._lock = threading.Lock()
+        self._cache = dict()
+        self._in_flight = dict()
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers)
+
+    @staticmethod
+    def getaddrinfo(host: str, port: int = None):
+        infos = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM)
+
+        # IPv4 first, like `socket.gethostbyname`, but IPv6-only hosts still resolve
+        ips = list()
+        for family in (socket.AF_INET, socket.AF_INET6):
+            for info in infos:
+                if info[0] == family and info[4][0] not in ips:
+                    ips.append(info[4][0])
+        return ips
+
+    def cached(self, host: str):
+        with self._lock:
+            item = self._cache.get(host)
+            if item and item[0] > time.time():
+                return item[1]
+            return None
+
+    def store(self, host: str, ips: list):
+        with self._lock:
+            self._cache[host] = (time.time() + (self._ttl if ips else self._negative_ttl), ips)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def submit(self, host: str):
+        with self._lock:
+            item = self._cache.get(host)
+            if item and item[0] > time.time():
+                future = futures.Future()
+                future.set_result(item[1])
+                return future
+
+            # share the lookup, if the same host is being resolved
+            future = self._in_flight.get(host)
+            if future is None:
+                future = self._executor.submit(self.__lookup, host)
+                self._in_flight[host] = future
+            return future
+
+    def __lookup(self, host: str):
+        try:
+            ips = self.getaddrinfo(host)
+        except (socket.gaierror, UnicodeError):
+            ips = list()
+
+        self.store(host, ips)
+        with self._lock:
+            self._in_flight.pop(host, None)
+        return ips
+
+    def resolve(self, host: str):
+        if common_patterns.is_ip_address(host):
+            return [host]
+
+        try:
+            return self.submit(host).result(timeout=self._timeout)
+        except futures.TimeoutError:
+            return list()
+
+    def resolve_one(self, host: str):
+        ips = self.resolve(host)
+        if ips:
+            return ips[0]
+        raise socket.gaierror('Cannot resolve "{}".'.format(host))
+
+    def resolve_many(self, hosts):
+        hosts = [host for host in set(hosts) if host and not common_patterns.is_ip_address(host)]
+        jobs = {host: self.submit(host) for host in hosts}
+
+        deadline = time.time() + self._timeout
+        results = dict()
+        for host, future in jobs.items():
+            try:
+                results[host] = future.result(timeout=max(deadline - time.time(), 0))
+            except futures.TimeoutError:
+                results[host] = list()
+        return results
+
+
+default_resolver = Resolver()
+
+
+def resolve_servers(nodes):
+    return default_resolver.resolve_many([node.server for node in nodes])
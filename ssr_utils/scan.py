@@ -0,0 +1,119 @@
+# coding:utf-8
+import io
+import mmap
+import collections
+from .node import parse_url
+from .node import fingerprint
+
+# same tokens as `common_patterns.findall_ssr_urls`, `ssr?://[A-Za-z0-9\-_]+`
+URL_CHARS = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+SEPARATOR = b'://'
+MAX_TOKEN_SIZE = 65536
+
+# recent raw strings skipped before parsing, bounded, the fingerprints are what is kept for the whole scan
+RECENT_URLS = 4096
+
+
+def _token_end(buffer: bytes, start: int, step: int = 4096):
+    # `lstrip` of the allowed bytes, in slices, so a long tail is not copied at every token
+    end = start
+    while True:
+        piece = buffer[end:end + step]
+        size = len(piece) - len(piece.lstrip(URL_CHARS))
+        end += size
+        if size < len(piece) or not piece:
+            return end
+
+
+def iter_tokens(f, chunk_size: int = 1 << 20):
+    # ss:// and ssr:// tokens, from `read` of a file object or a mmap, str or bytes chunks
+    carry = b''
+    while True:
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8', errors='ignore')
+        buffer = carry + chunk
+
+        pos = 0
+        pending = None
+        while True:
+            i = buffer.find(SEPARATOR, pos)
+            if i < 0:
+                break
+
+            if buffer[max(i - 3, 0):i] == b'ssr':
+                start = i - 3
+            elif buffer[max(i - 2, 0):i] == b'ss':
+                start = i - 2
+            else:
+                pos = i + 1
+                continue
+
+            end = _token_end(buffer, i + len(SEPARATOR))
+
+            # may go on in the next chunk, unless it is already too long to be a URL
+            if end == len(buffer) and not eof and end - start < MAX_TOKEN_SIZE:
+                pending = start
+                break
+
+            if end > i + len(SEPARATOR):
+                yield buffer[start:end].decode('ascii')
+            pos = end
+
+        if eof:
+            return
+
+        # a token, or the beginning of a scheme, crossing the chunk boundary
+        if pending is not None:
+            carry = buffer[pending:]
+        else:
+            carry = buffer[max(pos, len(buffer) - len(b'ssr:/')):]
+
+
+def scan_urls(f, chunk_size: int = 1 << 20, dedup: bool = True):
+    # lazily, once per node fingerprint, tokens which do not parse to a node are skipped
+    if isinstance(f, str):
+        f = io.StringIO(f)
+    elif isinstance(f, (bytes, bytearray)):
+        f = io.BytesIO(f)
+
+    seen = set()
+    recent = collections.OrderedDict()
+    for url in iter_tokens(f, chunk_size=chunk_size):
+        if not dedup:
+            yield url
+            continue
+
+        # repeated strings are common, mostly close together, skip them before parsing
+        if url in recent:
+            recent.move_to_end(url)
+            continue
+        recent[url] = None
+        if len(recent) > RECENT_URLS:
+            recent.popitem(last=False)
+
+        try:
+            node = parse_url(url)
+        except Exception:
+            continue
+        if not node or not node.is_valid:
+            continue
+
+        key = fingerprint(node)
+        if key not in seen:
+            seen.add(key)
+            yield url
+
+
+def scan_file(path_to_file: str, chunk_size: int = 1 << 20, dedup: bool = True):
+    with open(path_to_file, 'rb') as f:
+        try:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty
+            return
+
+        with m:
+            for url in scan_urls(m, chunk_size=chunk_size, dedup=dedup):
+                yield url
@@ -0,0 +1,231 @@
+# coding:utf-8
+import os
+import time
+import heapq
+import sqlite3
+import tempfile
+import threading
+import collections
+from concurrent import futures
+from .ssr import SSR
+from .errors import SystemNotSupportedException
+from .resolver import default_resolver
+from .metrics import default_metrics
+from .output import cp
+
+
+class CheckHistory:
+    # per node and per host, kept across runs
+    def __init__(self, path_to_db: str = os.path.join(tempfile.gettempdir(), 'ssr_utils_history.sqlite')):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path_to_db, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS nodes ('
+                           'fingerprint TEXT PRIMARY KEY, '
+                           'successes INTEGER NOT NULL DEFAULT 0, '
+                           'failures INTEGER NOT NULL DEFAULT 0, '
+                           'last_checked REAL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS hosts ('
+                           'host TEXT PRIMARY KEY, '
+                           'failures INTEGER NOT NULL DEFAULT 0, '
+                           'open_until REAL NOT NULL DEFAULT 0)')
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def nodes(self, keys):
+        # {fingerprint: (successes, failures, last_checked)}
+        keys = list(keys)
+        result = dict()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                for row in self._conn.execute(
+                        'SELECT fingerprint, successes, failures, last_checked FROM nodes WHERE fingerprint IN ({})'
+                        .format(','.join('?' * len(chunk))), chunk):
+                    result[row[0]] = row[1:]
+        return result
+
+    def hosts(self):
+        # {host: (failures, open_until)}
+        with self._lock:
+            return {row[0]: row[1:] for row in self._conn.execute('SELECT host, failures, open_until FROM hosts')}
+
+    def record(self, key: str, host: str, ok: bool, open_until: float = 0):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO nodes (fingerprint) VALUES (?)', (key,))
+            self._conn.execute('UPDATE nodes SET successes = successes + ?, failures = failures + ?, last_checked = ? '
+                               'WHERE fingerprint = ?', (1 if ok else 0, 0 if ok else 1, now, key))
+
+            if host is None:
+                return
+            self._conn.execute('INSERT OR IGNORE INTO hosts (host) VALUES (?)', (host,))
+            if ok:
+                self._conn.execute('UPDATE hosts SET failures = 0, open_until = 0 WHERE host = ?', (host,))
+            else:
+                self._conn.execute('UPDATE hosts SET failures = failures + 1, open_until = ? WHERE host = ?',
+                                   (open_until, host))
+
+
+class Scheduler:
+    def __init__(self,
+                 workers: int = 8,
+                 max_per_ip: int = 2,
+                 breaker_threshold: int = 3,
+                 breaker_backoff: float = 60,
+                 breaker_max_backoff: float = 6 * 3600,
+                 stale_after: float = 3600,
+                 history: CheckHistory = None,
+                 path_to_config: str = 'config.ini',
+                 settings=None,
+                 ):
+        self._workers = workers
+        self._max_per_ip = max_per_ip
+        self._breaker_threshold = breaker_threshold
+        self._breaker_backoff = breaker_backoff
+        self._breaker_max_backoff = breaker_max_backoff
+        self._stale_after = stale_after
+        self._history = history or CheckHistory()
+        self._path_to_config = path_to_config
+        self._settings = settings
+
+        # host -> (failures, open_until), also updated during a run
+        self._lock = threading.Lock()
+        self._hosts = dict()
+        self._skipped = list()
+
+    @property
+    def skipped(self):
+        # URLs of the last run behind an open breaker, yielded as `(url, None)` without a check
+        return list(self._skipped)
+
+    def priority(self, stats, now: float = None):
+        # success probability, Laplace smoothed, weighted up by staleness, never checked is fully stale
+        successes, failures, last_checked = stats or (0, 0, None)
+        p = (successes + 1) / (successes + failures + 2)
+        staleness = 1.0
+        if last_checked:
+            staleness = min(((now or time.time()) - last_checked) / self._stale_after, 1.0)
+        return p * (0.5 + staleness)
+
+    def is_open(self, host: str, now: float = None):
+        with self._lock:
+            failures, open_until = self._hosts.get(host, (0, 0))
+        return open_until > (now or time.time())
+
+    def __backoff(self, failures: int):
+        # exponential, once the threshold is reached
+        if failures < self._breaker_threshold:
+            return 0
+        return min(self._breaker_backoff * 2 ** (failures - self._breaker_threshold), self._breaker_max_backoff)
+
+    def __record(self, key: str, host: str, ok: bool):
+        with self._lock:
+            failures, _ = self._hosts.get(host, (0, 0))
+            failures = 0 if ok else failures + 1
+            open_until = time.time() + self.__backoff(failures) if failures >= self._breaker_threshold else 0
+            self._hosts[host] = (failures, open_until)
+        self._history.record(key, host, ok, open_until=open_until)
+
+    def run(self, urls, cache=None):
+        # (url, result), the likely and the stale first, at most `max_per_ip` at once per server IP
+        now = time.time()
+        with self._lock:
+            self._hosts = self._history.hosts()
+        self._skipped = list()
+
+        items = list()
+        for url in urls:
+            ssr = SSR(self._path_to_config, settings=self._settings)
+            ssr.url = url
+            if ssr.server:
+                items.append((url, ssr))
+        if not items:
+            return
+
+        # resolved at once, then by `server_ip` from the resolver cache
+        default_resolver.resolve_many([ssr.server for _, ssr in items])
+        stats = self._history.nodes(ssr.fingerprint for _, ssr in items)
+
+        # a queue per IP, by priority, and a heap of the IPs by the priority of their head
+        buckets = collections.defaultdict(list)
+        for seq, (url, ssr) in enumerate(items):
+            try:
+                ip = ssr.server_ip
+            except OSError:
+                ip = ssr.server
+
+            if self.is_open(ip, now):
+                default_metrics.count('scheduler_skipped_total', reason='breaker_open')
+                self._skipped.append(url)
+                yield url, None
+                continue
+
+            key = ssr.fingerprint
+            buckets[ip].append((-self.priority(stats.get(key), now), seq, url, ssr, key))
+        for bucket in buckets.values():
+            bucket.sort(reverse=True)
+
+        ready = [(bucket[-1][0], bucket[-1][1], ip) for ip, bucket in buckets.items()]
+        heapq.heapify(ready)
+        running = collections.Counter()
+
+        def check(ssr: SSR):
+            try:
+                return ssr.get_available(cache=cache)
+            except SystemNotSupportedException:
+                raise
+            except Exception as e:
+                cp.error(e)
+                return None
+
+        with futures.ThreadPoolExecutor(max_workers=self._workers) as executor:
+            pending = dict()
+            while ready or pending:
+                # fill the workers, from the IPs with capacity
+                while ready and len(pending) < self._workers:
+                    _, _, ip = heapq.heappop(ready)
+                    bucket = buckets[ip]
+
+                    # opened during this run
+                    if self.is_open(ip):
+                        default_metrics.count('scheduler_skipped_total', reason='breaker_open', value=len(bucket))
+                        for _, _, url, _, _ in bucket:
+                            self._skipped.append(url)
+                            yield url, None
+                        bucket.clear()
+                        continue
+
+                    _, _, url, ssr, key = bucket.pop()
+                    running[ip] += 1
+                    pending[executor.submit(check, ssr)] = (url, ssr, key, ip)
+
+                    if bucket and running[ip] < self._max_per_ip:
+                        heapq.heappush(ready, (bucket[-1][0], bucket[-1][1], ip))
+
+                if not pending:
+                    break
+
+                done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    url, ssr, key, ip = pending.pop(future)
+                    result = future.result()
+
+                    # rejected before anything was tried, or answered by the cache, says nothing new about the host
+                    if ssr.failure != 'rejected' and not ssr.from_cache:
+                        self.__record(key, ip, bool(result))
+
+                    # capacity back, the IP is ready again, unless it is queued already
+                    running[ip] -= 1
+                    bucket = buckets[ip]
+                    if bucket and running[ip] == self._max_per_ip - 1:
+                        heapq.heappush(ready, (bucket[-1][0], bucket[-1][1], ip))
+
+                    yield url, result
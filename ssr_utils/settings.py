@@ -0,0 +1,91 @@
+# coding:utf-8
+import threading
+import profig
+from collections.abc import Mapping
+
+DEFAULTS = {
+    'path.python': '/usr/bin/python3',
+    'path.python_ssr': '/data/repo/shadowsocksr/shadowsocks/local.py',
+    'path.proxychains4': '/usr/bin/proxychains4',
+    'ssr_utils.local_port': 13431,
+    'ssr_utils.port_range': 200,
+    'ssr_utils.path_to_pre_proxy': 'pre_proxy.txt',
+    'ssr_utils.proxychains4_cache_time': 300,
+    'ssr_utils.startup_timeout': 5.0,
+    'ssr_utils.check_timeout': 30.0,
+    'ssr_utils.prescreen': True,
+    'ssr_utils.prescreen_timeout': 2.0,
+    'ssr_utils.in_process': False,
+    'ssr_utils.config_delivery': 'stdin',
+    'ssr_utils.probe_url': '',
+    'ssr_utils.exit_ip_url': '',
+    'ssr_utils.path_to_geoip_csv': '',
+    'ssr_utils.result_cache': False,
+    'ssr_utils.path_to_result_cache': '',
+    'ssr_utils.result_ttl': 600,
+    'ssr_utils.result_negative_ttl': 120,
+}
+
+
+class Settings(Mapping):
+    def __init__(self, values: dict = None):
+        self._values = dict(DEFAULTS)
+        if values:
+            for key, value in values.items():
+                if key not in DEFAULTS:
+                    raise KeyError('Unknown setting `{}`.'.format(key))
+                self._values[key] = value
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return 'Settings({!r})'.format(self._values)
+
+    def replace(self, values: dict):
+        new_values = dict(self._values)
+        new_values.update(values)
+        return Settings(new_values)
+
+    @classmethod
+    def from_file(cls, path_to_config: str = 'config.ini'):
+        cfg = profig.Config(path_to_config)
+        for key, value in DEFAULTS.items():
+            cfg.init(key, value)
+        cfg.sync()
+
+        return cls({key: cfg[key] for key in DEFAULTS})
+
+
+_lock = threading.Lock()
+_settings = dict()
+
+
+def get_settings(path_to_config: str = 'config.ini'):
+    # loaded once per process, on first use
+    with _lock:
+        if path_to_config not in _settings:
+            _settings[path_to_config] = Settings.from_file(path_to_config)
+        return _settings[path_to_config]
+
+
+def set_settings(settings, path_to_config: str = 'config.ini'):
+    # programmatic, the file is never touched
+    if not isinstance(settings, Settings):
+        settings = Settings(settings)
+
+    with _lock:
+        _settings[path_to_config] = settings
+    return settings
+
+
+def reload_settings(path_to_config: str = 'config.ini'):
+    with _lock:
+        _settings[path_to_config] = Settings.from_file(path_to_config)
+        return _settings[path_to_config]
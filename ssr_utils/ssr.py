@@ -1,34 +1,64 @@
 # coding:utf-8
 import os
+import atexit
 import sys
 import time
 import socket
+import threading
+import itertools
 import requests_cache
 import proxy_fn
 import subprocess
-import profig
 import tempfile
 import common_patterns
-import cli_print as cp
-import urllib.parse
-import proxychains_conf_generator
-import ip_query
+from concurrent import futures
 from qwert import list_fn
-from qwert import file_fn
 from qwert import base64
 from .errors import *
+from .resolver import default_resolver
+from .node import parse_url
+from .node import fingerprint
+from .node import config_json
+from .node import encode_url
+from .settings import Settings
+from .settings import get_settings
+from .probe import get_exit_ip_lookup
+from .pre_proxy import get_pre_proxy_manager
+from .bench import DEFAULT_BENCH_URL
+from .bench import benchmark_tunnel
+from .net import USER_AGENT
+from .metrics import default_metrics
+from .ports import PortAllocator
+from .ports import get_port_allocator
+from .cache import get_result_cache
+from .supervise import FATAL_FAILURES
+from .supervise import LOCAL_FAILURES
+from .supervise import OutputTail
+from .supervise import classify
+from .supervise import reject_reason
+from .prescreen import get_prescreen
+from .prescreen import use_prescreen
+from .inprocess import LocalServer
+from .inprocess import is_supported
+from .output import cp
+
+# temp config files written, removed at exit if a check did not get to it
+_config_files = set()
+
+
+@atexit.register
+def _remove_config_files():
+    for path_to_file in list(_config_files):
+        if os.path.exists(path_to_file):
+            os.remove(path_to_file)
 
 
 class SSR:
-    def __init__(self, path_to_config: str = 'config.ini'):
-        self._cfg = profig.Config(path_to_config)
-        self._cfg.init('path.python', '/usr/bin/python3')
-        self._cfg.init('path.python_ssr', '/data/repo/shadowsocksr/shadowsocks/local.py')
-        self._cfg.init('path.proxychains4', '/usr/bin/proxychains4')
-        self._cfg.init('ssr_utils.local_port', 13431)
-        self._cfg.init('ssr_utils.path_to_pre_proxy', 'pre_proxy.txt')
-        self._cfg.init('ssr_utils.proxychains4_cache_time', 300)
-        self._cfg.sync()
+    def __init__(self, path_to_config: str = 'config.ini', settings=None):
+        # loaded lazily, see `_cfg`
+        if isinstance(settings, dict):
+            settings = Settings(settings)
+        self._settings = settings
 
         self._path_to_config = path_to_config
 
@@ -56,8 +86,31 @@ class SSR:
         self._cmd = None
         self._cmd_prefix = None
         self._sub_progress = None
+        self._pool_worker = None
+        self._deadline = None
+        self._failure = None
+        self._from_cache = False
+        self._stderr_tail = None
+        self._port_lease = None
+        self._exit_ip_lookup = None
+        self._metrics = default_metrics
+        self._config_json = None
+
+        # cached, until the attributes change
+        self._url = None
+        self._invalid = None
         pass
 
+    @property
+    def _cfg(self):
+        if self._settings is None:
+            self._settings = get_settings(self._path_to_config)
+        return self._settings
+
+    @property
+    def settings(self):
+        return self._cfg
+
     def __reset_attributes(self):
         self._server = ''
         self._port = 443
@@ -80,6 +133,9 @@ class SSR:
 
         self._exit_ip = None
 
+        self._url = None
+        self._invalid = None
+
     @property
     def server(self):
         return self._server
@@ -119,6 +175,7 @@ class SSR:
     @remarks.setter
     def remarks(self, value: str):
         self._remarks = value
+        self._url = None
 
     @property
     def group(self):
@@ -127,6 +184,12 @@ class SSR:
     @group.setter
     def group(self, value: str):
         self._group = value
+        self._url = None
+
+    def _set_server(self, server: str):
+        # e.g. the IP once checked by it, the URL follows
+        self._server = server
+        self._url = None
 
     @property
     def server_ip(self):
@@ -141,8 +204,8 @@ class SSR:
         # domain
         self._server_domain = self.server
 
-        # domain 2 exit_ip
-        self._server_ip = socket.gethostbyname(self._server_domain)
+        # domain 2 exit_ip, cached and shared by all instances
+        self._server_ip = default_resolver.resolve_one(self._server_domain)
         return self._server_ip
 
     @property
@@ -182,6 +245,16 @@ class SSR:
     def exit_ip(self):
         return self._exit_ip
 
+    @property
+    def failure(self):
+        # why the last check failed, e.g. `rejected`, `unsupported_method`, `timeout`
+        return self._failure
+
+    @property
+    def from_cache(self):
+        # the last check was answered by the result cache
+        return self._from_cache
+
     @property
     def exit_country(self):
         if self._exit_ip:
@@ -195,44 +268,32 @@ class SSR:
         return None
 
     @property
-    def pc4_conf_file(self):
-        if os.path.exists(self._cfg['ssr_utils.path_to_pre_proxy']):
-            path_to_pc4_conf_file = os.path.join(tempfile.gettempdir(), 'ssr_utils_pc4.conf')
-
-            if os.path.exists(path_to_pc4_conf_file) and \
-                    time.time() - os.stat(path_to_pc4_conf_file).st_mtime \
-                    < self._cfg['ssr_utils.proxychains4_cache_time']:
-                return path_to_pc4_conf_file
-
-            lines = file_fn.read_to_list(self._cfg['ssr_utils.path_to_pre_proxy'])
-            if lines:
-                lines = list_fn.unique(lines)
-                for line in lines:
-                    requests_proxies = proxy_fn.line2requests_proxies(line)
-
-                    # valid, and generate pc4 conf
-                    try:
-                        ip = ip_query.ip_query(requests_proxies=requests_proxies)
-                        if ip:
-                            g = proxychains_conf_generator.Generator(
-                                proxy=line,
-                                quiet_mode=True,
-                            )
-                            return g.write(path_to_conf=path_to_pc4_conf_file)
-
-                    except Exception as e:
-                        cp.error(e)
-                        pass
-
-            cp.error('No available proxy in "{}". Remove it if do not need a proxy.'.format(
-                self._cfg['ssr_utils.path_to_pre_proxy'],
-            ))
-            cp.ex()
+    def metrics(self):
+        return self._metrics
 
-        return None
+    @metrics.setter
+    def metrics(self, value):
+        self._metrics = value
+
+    @property
+    def exit_ip_lookup(self):
+        if self._exit_ip_lookup is None:
+            self._exit_ip_lookup = get_exit_ip_lookup(self._cfg)
+        return self._exit_ip_lookup
+
+    @exit_ip_lookup.setter
+    def exit_ip_lookup(self, value):
+        self._exit_ip_lookup = value
+
+    @property
+    def pc4_conf_file(self):
+        return get_pre_proxy_manager(self._cfg, lookup=self.exit_ip_lookup).pc4_conf_file
 
     @property
     def invalid_attributes(self):
+        if self._invalid is not None:
+            return self._invalid
+
         keys = [
             'server',
             'port',
@@ -242,11 +303,13 @@ class SSR:
             'obfs',
         ]
 
+        self._invalid = False
         for key in keys:
             if not getattr(self, key):
                 cp.error('Attribute `{}` is invalid.'.format(key))
-                return True
-        return False
+                self._invalid = True
+                break
+        return self._invalid
 
     def load(self, obj):
         self.__reset_attributes()
@@ -317,107 +380,33 @@ class SSR:
             'group': self.group,
         }
 
+    @property
+    def fingerprint(self):
+        # by the server as given, a check by IP replaces a domain by its IP
+        return fingerprint(self, server=self.server_domain or self.server)
+
     @property
     def url(self):
         # check attributes
         if self.invalid_attributes:
             return None
 
-        prefix = '{server}:{port}:{protocol}:{method}:{obfs}:{password}'.format(
-            server=self._server,
-            port=self._port,
-            protocol=self._protocol,
-            method=self._method,
-            obfs=self._obfs,
-            password=base64.encode(self._password, urlsafe=True))
-
-        suffix_list = []
-        if self._proto_param:
-            suffix_list.append('protoparam={proto_param}'.format(
-                proto_param=base64.encode(self.proto_param, urlsafe=True),
-            ))
-
-        if self._obfs_param:
-            suffix_list.append('obfsparam={obfs_param}'.format(
-                obfs_param=base64.encode(self.obfs_param, urlsafe=True),
-            ))
-
-        suffix_list.append('remarks={remarks}'.format(
-            remarks=base64.encode(self.remarks, urlsafe=True),
-        ))
-
-        suffix_list.append('group={group}'.format(
-            group=base64.encode(self.group, urlsafe=True),
-        ))
-
-        return 'ssr://{}'.format(base64.encode('{prefix}/?{suffix}'.format(
-            prefix=prefix,
-            suffix='&'.join(suffix_list),
-        ), urlsafe=True))
+        if self._url is None:
+            self._url = encode_url(self)
+        return self._url
 
     @url.setter
     def url(self, url: str):
         self.__reset_attributes()
 
-        r = url.split('://')
-
         try:
-            if r[0] == 'ssr':
-                self.__parse_ssr(r[1])
-            elif r[0] == 'ss':
-                self.__parse_ss(r[1])
+            node = parse_url(url)
+            if node:
+                self.load(node)
         except Exception as e:
             cp.error(e)
             pass
 
-    def __parse_ssr(self, ssr_base64: str):
-        ssr = ssr_base64.split('#')[0]
-        ssr = base64.decode(ssr)
-
-        if isinstance(ssr, bytes):
-            return
-
-        ssr_list = ssr.split(':')
-        password_and_params = ssr_list[5].split('/?')
-
-        self._server = ssr_list[0]
-        self._port = int(ssr_list[1])
-        self._protocol = ssr_list[2]
-        self._method = ssr_list[3]
-        self._obfs = ssr_list[4]
-        self._password = base64.decode(password_and_params[0])
-
-        params_dict = dict()
-        for param in password_and_params[1].split('&'):
-            param_list = param.split('=')
-            params_dict[param_list[0]] = base64.decode(param_list[1])
-
-        params_dict_keys = params_dict.keys()
-        for key in ['proto_param', 'obfs_param', 'remarks', 'group']:
-            tmp_key = key.replace('_', '')
-            if tmp_key in params_dict_keys:
-                setattr(self, '_{}'.format(key), params_dict[tmp_key])
-
-    def __parse_ss(self, ss_base64: str):
-        ss = ss_base64.split('#')
-        if len(ss) > 1:
-            self._remarks = urllib.parse.unquote(ss[1])
-        ss = base64.decode(ss[0])
-
-        if isinstance(ss, bytes):
-            return
-
-        # use split and join, in case of the password contains "@"/":"
-        str_list = ss.split('@')
-
-        server_and_port = str_list[-1].split(':')
-        method_and_pass = '@'.join(str_list[0:-1]).split(':')
-
-        self._server = server_and_port[0]
-        self._port = int(server_and_port[1])
-        self._method = method_and_pass[0]
-        self._password = ':'.join(method_and_pass[1:])
-
     @property
     def plain(self):
         # check attributes
@@ -454,25 +443,11 @@ class SSR:
         if self.invalid_attributes:
             return None
 
-        configs = list()
-
-        # by: ip / server
-        if by_ip:
-            configs.append('"server": "{}",'.format(self.server_ip))
-        else:
-            configs.append('"server": "{}",'.format(self.server))
-
-        configs.append('"server_port": {},'.format(self.port))
-        configs.append('"method": "{}",'.format(self.method))
-        configs.append('"password": "{}",'.format(self.password))
-        configs.append('"protocol": "{}",'.format(self.protocol))
-        configs.append('"protocol_param": "{}",'.format(self.proto_param))
-        configs.append('"obfs": "{}",'.format(self.obfs))
-        configs.append('"obfs_param": "{}",'.format(self.obfs_param))
-        configs.append('"local_address": "{}",'.format(self.local_address))
-        configs.append('"local_port": {}'.format(self.local_port))
-
-        return '{\n' + '\n'.join(configs) + '\n}'
+        return config_json(self,
+                           server=self.server_ip if by_ip else self.server,
+                           local_address=self.local_address,
+                           local_port=self.local_port,
+                           )
 
     def write_config_file(self, path_to_file=None, by_ip: bool = False, plain_to_console: bool = False):
         # check attributes
@@ -483,7 +458,7 @@ class SSR:
             self._path_to_ssr_conf = path_to_file
 
         cp.about_t('Generating', self.path_to_ssr_conf, 'for shadowsocksr')
-        with open(self.path_to_ssr_conf, 'wb') as f:
+        with self._metrics.span('config_write'), open(self.path_to_ssr_conf, 'wb') as f:
             json_string = self.get_config_json_string(by_ip=by_ip)
             f.write(json_string.encode('utf-8'))
             cp.success()
@@ -494,7 +469,7 @@ class SSR:
     def is_available(self):
         return self.get_available()
 
-    def get_available(self):
+    def get_available(self, pool=None, cache=None):
         if self.invalid_attributes:
             return None
 
@@ -502,121 +477,593 @@ class SSR:
         if 'win32' == sys.platform:
             raise SystemNotSupportedException('Cannot use property `is_available` in windows.')
 
+        # known-bad, e.g. an AEAD cipher, not worth a sub progress
+        self._from_cache = False
+        reason = reject_reason(self)
+        if reason:
+            cp.error('Rejected: {}.'.format(reason))
+            self._failure = 'rejected'
+            self._metrics.count('checks_total', result='rejected')
+            return None
+
+        # `None` falls back to `ssr_utils.result_cache`, `True` is the cache of the settings
+        if cache is None:
+            cache = self._cfg['ssr_utils.result_cache']
+        if cache is True:
+            cache = get_result_cache(self._cfg)
+
+        key = self.fingerprint
+        if cache:
+            hit, ip = cache.get(key)
+            if hit:
+                self._metrics.count('cache_hits_total', result='success' if ip else 'failure')
+                self._from_cache = True
+                if ip:
+                    self._exit_ip = ip
+                return ip
+
         # READY
         cp.job('CHECK AVAILABLE')
 
-        self._path_to_ssr_conf = os.path.join(tempfile.gettempdir(), 'ssr_utils_{time}.json'.format(
-            time=str(time.time()).replace('.', '').ljust(17, '0'),
-        ))
+        try:
+            with self._metrics.span('check', server=self.server):
+                ip = self.__with_pool(pool, self.__get_available)
+        except Exception as e:
+            self._metrics.count('errors_total', type=type(e).__name__)
+            self._metrics.count('checks_total', result='error')
+            raise
+
+        self._metrics.count('checks_total', result='success' if ip else 'failure')
+        if cache and (ip or self._failure not in LOCAL_FAILURES):
+            cache.store(key, ip)
+        return ip
+
+    def benchmark(self, url: str = DEFAULT_BENCH_URL, samples: int = 5, timeout: float = 10, pool=None):
+        if self.invalid_attributes:
+            return None
+
+        # check system
+        if 'win32' == sys.platform:
+            raise SystemNotSupportedException('Cannot use method `benchmark` in windows.')
+
+        # READY
+        cp.job('BENCHMARK')
+
+        return self.__with_pool(pool, lambda: self.__benchmark(url=url, samples=samples, timeout=timeout))
+
+    def open_tunnel(self, verify: bool = True):
+        # a long-lived SSR on `local_port`, until `close_tunnel`, e.g. for `Gateway`
+        if self.invalid_attributes or reject_reason(self):
+            return False
+
+        # check system
+        if 'win32' == sys.platform:
+            raise SystemNotSupportedException('Cannot use method `open_tunnel` in windows.')
+
+        self.close_tunnel()
+        if not self._local_port:
+            self._port_lease = get_port_allocator(self._cfg).acquire()
+            self.local_port = self._port_lease.port
+
+        self._deadline = None
+        self._failure = None
+        self._set_check_cmd(pc4_conf_file=self.pc4_conf_file)
+
+        try:
+            self._prepare_config(by_ip=True)
+            if not self.__spawn('as a tunnel'):
+                self.close_tunnel()
+                return False
+
+            ready = self.__wait_for_local_port()
+        finally:
+            # read at start
+            self._remove_ssr_conf()
+            cp.lx(1)
+
+        if not ready:
+            self.close_tunnel()
+            self.__fail('PortNotReady')
+            return False
+
+        if verify:
+            ip = self.__query_exit_ip()
+            if not ip:
+                self.close_tunnel()
+                return False
+            self._exit_ip = ip
+
+        return True
+
+    def verify_tunnel(self):
+        # the exit IP again, through the open tunnel
+        if not self.tunnel_alive:
+            return False
+        ip = self.__query_exit_ip()
+        if ip:
+            self._exit_ip = ip
+        return bool(ip)
+
+    def close_tunnel(self):
+        if self._sub_progress:
+            # a group leader, see `setsid`
+            if self._sub_progress.poll() is None:
+                self.__kill(self._sub_progress.pid)
+            self._sub_progress.wait()
+            self._sub_progress = None
+
+        if self._port_lease:
+            self._port_lease.release()
+            self._port_lease = None
+            self.local_port = None
+
+    @property
+    def tunnel_alive(self):
+        return self._sub_progress is not None and self._sub_progress.poll() is None
+
+    def __with_pool(self, pool, fn):
+        if pool is None:
+            if self._local_port:
+                return fn()
+
+            # a free port of the range, leased until the SSR sub progress is killed
+            with get_port_allocator(self._cfg).acquire() as lease:
+                self.local_port = lease.port
+                try:
+                    return fn()
+                finally:
+                    self.local_port = None
+
+        # warm SSR from the pool, on the port leased by the worker
+        local_port = self._local_port
+        self._pool_worker = pool.acquire()
+        self.local_port = self._pool_worker.port
+        try:
+            return fn()
+        finally:
+            pool.release(self._pool_worker)
+            self._pool_worker = None
+            self.local_port = local_port
+
+    def __get_available(self):
+        self._deadline = time.time() + self._cfg['ssr_utils.check_timeout']
+        self._failure = None
+
+        with self._metrics.span('pre_proxy'):
+            pc4_conf_file = self.pc4_conf_file
+
+        # a TCP connect first, most dead nodes end here
+        if not pc4_conf_file and self._cfg['ssr_utils.prescreen']:
+            with self._metrics.span('prescreen'):
+                reachable = get_prescreen(self._cfg).is_reachable(self.server, self.port)
+            if not reachable:
+                cp.error('Cannot connect to {}:{}.'.format(self.server, self.port))
+                self.__fail('unreachable')
+                return None
+
+        # no sub progress, for what can be done in this process
+        if not pc4_conf_file and self._cfg['ssr_utils.in_process'] and is_supported(self):
+            return self.__ip_query_in_process()
+
+        self._set_check_cmd(pc4_conf_file=pc4_conf_file)
+
+        try:
+            # By server_ip
+            self._prepare_config(by_ip=True)
+
+            ip = self.__ip_query(hint='by IP')
+            if ip:
+                self._set_server(self._server_ip)
+                return ip
+
+            # By server/domain, unless it would fail the same way, or the deadline of the check is gone
+            if self.server_ip != self.server and self._failure not in FATAL_FAILURES and self._failure != 'timeout':
+                self._prepare_config()
+                return self.__ip_query(hint='by Server/Domain')
+
+            return None
+
+        finally:
+            self._remove_ssr_conf()
+            cp.lx(1)
+
+    def __benchmark(self, url: str, samples: int, timeout: float):
+        # as long as the samples take
+        self._deadline = None
+        self._failure = None
+
+        with self._metrics.span('pre_proxy'):
+            pc4_conf_file = self.pc4_conf_file
+        self._set_check_cmd(pc4_conf_file=pc4_conf_file)
+
+        try:
+            self._prepare_config(by_ip=True)
+            return self.__run_in_tunnel('for benchmark', lambda: self.__benchmark_tunnel(url, samples, timeout))
+        finally:
+            self._remove_ssr_conf()
+            cp.lx(1)
+
+    def __benchmark_tunnel(self, url: str, samples: int, timeout: float):
+        cp.about_t('Benchmark', url, '{} samples'.format(samples))
+        with self._metrics.span('benchmark', server=self.server):
+            result = benchmark_tunnel(self.local_address, self.local_port, url=url, samples=samples, timeout=timeout)
+        if result:
+            cp.success('TTFB p50 {:.3f}s, {:.1f} KB/s'.format(result['ttfb']['p50'],
+                                                              result['throughput']['p50'] / 1024))
+        else:
+            cp.fx()
+        return result
+
+    @property
+    def _config_by_stdin(self):
+        return self._cfg['ssr_utils.config_delivery'] == 'stdin'
+
+    def _prepare_config(self, by_ip: bool = False):
+        if self._config_by_stdin:
+            with self._metrics.span('config_write'):
+                self._config_json = self.get_config_json_string(by_ip=by_ip)
+        else:
+            self._config_json = None
+            _config_files.add(self.path_to_ssr_conf)
+            self.write_config_file(by_ip=by_ip)
+
+    def _set_check_cmd(self, pc4_conf_file: str = None):
+        # the child reads its config from stdin, or from a temp file as a fallback
+        if self._config_by_stdin:
+            self._path_to_ssr_conf = '/dev/stdin'
+        else:
+            self._path_to_ssr_conf = os.path.join(tempfile.gettempdir(), 'ssr_utils_{time}_{port}.json'.format(
+                time=str(time.time()).replace('.', '').ljust(17, '0'),
+                port=self.local_port,
+            ))
 
         # cmd with pc4
-        pc4_conf_file = self.pc4_conf_file
         if pc4_conf_file:
             cp.about_to('Use', pc4_conf_file, 'for proxychains')
-            self._cmd = '{path_to_pc4} -q -f {pc4_conf_file} '.format(
+            self._cmd_prefix = '{path_to_pc4} -q -f {pc4_conf_file} '.format(
                 path_to_pc4=self._cfg['path.proxychains4'],
                 pc4_conf_file=pc4_conf_file,
             )
         else:
-            self._cmd = ''
+            self._cmd_prefix = ''
+
+        # Python
+        self._cmd_prefix += '{python} '.format(python=self._cfg['path.python'])
 
         # Python SSR
-        self._cmd += '{python} {python_ssr} -c {path_to_config}'.format(
-            python=self._cfg['path.python'],
+        self._cmd = self._cmd_prefix + '{python_ssr} -c {path_to_config}'.format(
             python_ssr=self._cfg['path.python_ssr'],
             path_to_config=self.path_to_ssr_conf,
         )
 
-        # By server_ip
-        self.write_config_file(by_ip=True)
-
-        ip = self.__ip_query(hint='by IP')
+    def __ip_query(self, hint: str):
+        ip = self.__run_in_tunnel(hint, self.__query_exit_ip)
         if ip:
-            self._server = self._server_ip
-            self.__remove_ssr_conf()
-            print()
+            self._exit_ip = ip
             return ip
 
-        # By server/domain
-        if self.server_ip != self.server:
-            self.write_config_file()
-            ip = self.__ip_query(hint='by Server/Domain')
-            self.__remove_ssr_conf()
-            print()
+        return None
+
+    def __ip_query_in_process(self):
+        cp.about_t('Start an SS tunnel in process', 'by IP')
+
+        # resolved first, a gaierror is an OSError as well, but not of the bind
+        try:
+            server_ip = self.server_ip
+        except (socket.gaierror, UnicodeError) as e:
+            cp.fx()
+            cp.error(e)
+            self.__fail('dns_error')
+            return None
+
+        try:
+            with self._metrics.span('spawn', hint='in process'):
+                local_server = LocalServer(server=server_ip,
+                                           port=self.port,
+                                           method=self.method,
+                                           password=self.password,
+                                           local_address=self.local_address,
+                                           local_port=self.local_port,
+                                           timeout=self._cfg['ssr_utils.startup_timeout'],
+                                           )
+                local_server.start()
+        except OSError as e:
+            cp.fx()
+            cp.error(e)
+            self.__fail('bind_error')
+            return None
+        cp.success(' Next.')
+
+        try:
+            ip = self.__query_exit_ip()
+        finally:
+            local_server.stop()
+            cp.lx(1)
+
+        if ip:
+            self._exit_ip = ip
+            self._set_server(self._server_ip)
             return ip
 
         return None
 
-    def __ip_query(self, hint: str):
+    def __query_exit_ip(self):
+        cp.about_t('Try to request for the IP address')
+
+        start = time.time()
+        with self._metrics.span('exit_ip', server=self.server):
+            ip = self.exit_ip_lookup(requests_proxies=proxy_fn.requests_proxies(host=self.local_address,
+                                                                                port=self.local_port,
+                                                                                ))
+
+        # the round trip through the tunnel, unless the lookup measured one, ranks and is cached with the result
+        if ip and ip.get('latency') is None:
+            ip['latency'] = time.time() - start
+
+        if ip:
+            cp.success('{} {}'.format(ip['ip'], ip['country']))
+        else:
+            cp.fx()
+        return ip
+
+    def __run_in_tunnel(self, hint: str, job):
         cp.about_t('Start a sub progress of SSR', hint)
 
+        # the deadline of the whole check, across the attempts
+        if self._deadline and time.time() >= self._deadline:
+            cp.fx()
+            self.__fail('timeout')
+            return None
+
         # sub progress
-        self._sub_progress = subprocess.Popen(
-            self._cmd.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            preexec_fn=os.setsid,
-        )
+        if not self.__spawn(hint):
+            return None
+        stderr_tail = self._stderr_tail
 
-        # Group PID
-        gpid = os.getpgid(self._sub_progress.pid)
+        # Group PID, the child is a setsid leader, asking would race a pool child reaped already
+        gpid = self._sub_progress.pid
         cp.wr(cp.Fore.LIGHTYELLOW_EX + '(G)PID {} '.format(gpid))
 
-        # wait, during the progress launching.
-        for i in range(0, 5):
-            cp.wr(cp.Fore.LIGHTBLUE_EX + '.')
-            cp.fi()
-            time.sleep(1)
-        cp.success(' Next.')
+        # hard deadline, killing the child breaks the job off as well
+        timer = None
+        if self._deadline:
+            timer = threading.Timer(max(self._deadline - time.time(), 0), self.__kill, args=(gpid,))
+            timer.daemon = True
+            timer.start()
 
-        # Request for IP
-        ip = None
+        result = None
+        ready = False
+        exited = False
         try:
-            cp.about_t('Try to request for the IP address')
-
-            ip = ip_query.ip_query(requests_proxies=proxy_fn.requests_proxies(host=self.local_address,
-                                                                              port=self.local_port,
-                                                                              ))
-
-            if ip:
-                cp.success('{} {}'.format(ip['ip'], ip['country']))
+            # wait, during the progress launching.
+            with self._metrics.span('port_ready', hint=hint):
+                ready = self.__wait_for_local_port()
+            if ready:
+                cp.success(' Next.')
+                result = job()
             else:
                 cp.fx()
+                exited = self._sub_progress.poll() is not None
 
         except Exception as e:
             # ConnectionError?
             cp.fx()
             cp.error(e)
+            self.__fail(type(e).__name__)
 
         finally:
+            if timer:
+                timer.cancel()
+
             cp.about_t('Kill SSR sub progress', 'PID {pid}'.format(pid=gpid))
-            os.killpg(gpid, 9)
+            with self._metrics.span('kill'):
+                self.__kill(gpid)
+                self._sub_progress.wait()
             cp.success('Done.')
 
-        if ip:
-            self._exit_ip = ip
-            return ip
+        # why it did not come up
+        if exited:
+            kind = classify(stderr_tail.text()) if stderr_tail else 'exited'
+            cp.error('SSR sub progress exited: {}'.format(kind))
+            self.__fail(kind)
+        elif not ready:
+            self.__fail('timeout' if self._deadline and time.time() >= self._deadline else 'PortNotReady')
 
-        return None
+        return result
+
+    def __spawn(self, hint: str):
+        # `_sub_progress`, and `_stderr_tail` unless it is forked by the pool
+        self._stderr_tail = None
+        try:
+            with self._metrics.span('spawn', hint=hint):
+                if self._pool_worker:
+                    self._sub_progress = self._pool_worker.start(cmd_prefix=self._cmd_prefix,
+                                                                 path_to_python_ssr=self._cfg['path.python_ssr'],
+                                                                 path_to_ssr_conf=self.path_to_ssr_conf,
+                                                                 config_json=self._config_json,
+                                                                 )
+                else:
+                    # stdout discarded, stderr drained, a full pipe would block the child
+                    self._sub_progress = subprocess.Popen(
+                        self._cmd.split(),
+                        stdin=subprocess.PIPE if self._config_json else None,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.PIPE,
+                        preexec_fn=os.setsid,
+                    )
+                    self._stderr_tail = OutputTail(self._sub_progress.stderr)
+                    if self._config_json:
+                        try:
+                            self._sub_progress.stdin.write(self._config_json.encode('utf-8'))
+                            self._sub_progress.stdin.close()
+                        except BrokenPipeError:
+                            # died at once, seen by the port check
+                            pass
+        except ChildProcessError as e:
+            cp.fx()
+            cp.error(e)
+            self.__fail(type(e).__name__)
+            return False
+        return True
 
-    def __remove_ssr_conf(self):
-        cp.about_t('Deleting', self.path_to_ssr_conf, 'config file')
-        os.remove(self.path_to_ssr_conf)
+    def __fail(self, kind: str):
+        self._failure = kind
+        self._metrics.count('errors_total', type=kind)
+
+    @staticmethod
+    def __kill(gpid: int):
+        try:
+            os.killpg(gpid, 9)
+        except ProcessLookupError:
+            # exited already
+            pass
+
+    def _remove_ssr_conf(self):
+        path_to_ssr_conf = self._path_to_ssr_conf
+        if not path_to_ssr_conf or path_to_ssr_conf not in _config_files:
+            return
+
+        cp.about_t('Deleting', path_to_ssr_conf, 'config file')
+        with self._metrics.span('cleanup'):
+            _config_files.discard(path_to_ssr_conf)
+            if os.path.exists(path_to_ssr_conf):
+                os.remove(path_to_ssr_conf)
         cp.success()
 
+    def __wait_for_local_port(self):
+        # poll the local port with exponential backoff, until it is open, the deadline or the progress died.
+        deadline = time.time() + self._cfg['ssr_utils.startup_timeout']
+        if self._deadline:
+            deadline = min(deadline, self._deadline)
+        delay = 0.05
+        while time.time() < deadline:
+            cp.wr(cp.Fore.LIGHTBLUE_EX + '.')
+            cp.fi()
+
+            if self.__is_port_open(port=self.local_port, host=self.local_address):
+                return True
+
+            if self._sub_progress.poll() is not None:
+                cp.wr(cp.Fore.LIGHTRED_EX + ' exited({})'.format(self._sub_progress.returncode))
+                return False
+
+            time.sleep(min(delay, max(deadline - time.time(), 0)))
+            delay = min(delay * 2, 0.5)
+
+        return False
+
     @staticmethod
-    def __is_port_open(port: int):
-        cp.about_t('Checking', 'local port #.{}'.format(port))
+    def __is_port_open(port: int, host: str = '127.0.0.1', timeout: float = 0.2):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            try:
+                s.connect((host, port))
+                s.shutdown(2)
+                return True
+            except OSError:
+                return False
 
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            s.connect(('127.0.0.1', port))
-            s.shutdown(2)
-            cp.success('is open')
-            return True
-        except:
-            cp.success('is down')
-            return False
+    @staticmethod
+    def check_many(urls,
+                   workers: int = 8,
+                   local_port: int = None,
+                   path_to_config: str = 'config.ini',
+                   pool=None,
+                   settings=None,
+                   cache=None,
+                   ):
+        return SSR.__map(urls,
+                         job=lambda ssr, pool_: ssr.get_available(pool=pool_, cache=cache),
+                         workers=workers,
+                         local_port=local_port,
+                         path_to_config=path_to_config,
+                         pool=pool,
+                         settings=settings,
+                         )
+
+    @staticmethod
+    def benchmark_many(urls,
+                       url: str = DEFAULT_BENCH_URL,
+                       samples: int = 5,
+                       timeout: float = 10,
+                       workers: int = 8,
+                       local_port: int = None,
+                       path_to_config: str = 'config.ini',
+                       pool=None,
+                       settings=None,
+                       ):
+        return SSR.__map(urls,
+                         job=lambda ssr, pool_: ssr.benchmark(url=url, samples=samples, timeout=timeout, pool=pool_),
+                         workers=workers,
+                         local_port=local_port,
+                         path_to_config=path_to_config,
+                         pool=pool,
+                         settings=settings,
+                         )
+
+    @staticmethod
+    def __map(urls, job, workers: int, local_port: int, path_to_config: str, pool, settings):
+        if isinstance(settings, dict):
+            settings = Settings(settings)
+        cfg = settings or get_settings(path_to_config)
+
+        # one local port per job, leased for its duration
+        if local_port:
+            allocator = PortAllocator(port_min=local_port, port_max=local_port + workers - 1)
+        else:
+            allocator = get_port_allocator(cfg)
+
+        # unique endpoints of a batch are connected to at once, the unreachable never take a worker
+        screen = get_prescreen(cfg) if use_prescreen(cfg) else None
+        urls = iter(urls)
+
+        def run(ssr: SSR):
+            # the pool workers hold leases of their own
+            lease = None if pool else allocator.acquire()
+            try:
+                if lease:
+                    ssr.local_port = lease.port
+                return job(ssr, pool)
+            except SystemNotSupportedException:
+                raise
+            except Exception as e:
+                cp.error(e)
+                return None
+            finally:
+                if lease:
+                    lease.release()
+
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = dict()
+            while True:
+                batch = list()
+                for url in itertools.islice(urls, max(workers * 8, 256)):
+                    ssr = SSR(path_to_config, settings=settings)
+                    ssr.url = url
+                    reachable = None
+                    if screen and ssr.server and ssr.port:
+                        reachable = screen.submit(ssr.server, ssr.port)
+                    batch.append((url, ssr, reachable))
+                if not batch:
+                    break
+
+                for url, ssr, reachable in batch:
+                    if reachable and not reachable.result():
+                        ssr._metrics.count('errors_total', type='unreachable')
+                        ssr._metrics.count('checks_total', result='failure')
+                        yield url, None
+                        continue
+
+                    # keep the number of queued jobs bounded
+                    if len(pending) >= workers * 2:
+                        done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                        for future in done:
+                            yield pending.pop(future), future.result()
+
+                    pending[executor.submit(run, ssr)] = url
+
+            for future in futures.as_completed(pending):
+                yield pending[future], future.result()
 
 
 def get_urls_by_subscribe(url: str,
@@ -634,10 +1081,7 @@ def get_urls_by_subscribe(url: str,
     # request headers
     request_session.headers.update(
         {
-            'User-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                          'AppleWebKit/537.36 (KHTML, like Gecko) '
-                          'Chrome/71.0.3578.80 '
-                          'Safari/537.36'
+            'User-agent': USER_AGENT,
         }
     )
 
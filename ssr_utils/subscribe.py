@@ -0,0 +1,129 @@
+# coding:utf-8
+import base64
+import binascii
+import threading
+import requests
+from concurrent import futures
+from requests.adapters import HTTPAdapter
+from .net import USER_AGENT
+from .output import cp
+
+
+def iter_base64_lines(chunks):
+    # decode a base64 stream, in blocks of 4 chars, and split it to lines on the fly
+    translate = bytes.maketrans(b'-_', b'+/')
+    pending = b''
+    rest = b''
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        pending += b''.join(chunk.split()).translate(translate)
+
+        size = len(pending) - len(pending) % 4
+        if not size:
+            continue
+
+        try:
+            rest += base64.b64decode(pending[:size])
+        except binascii.Error:
+            return
+        pending = pending[size:]
+
+        lines = rest.split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line
+
+    if pending:
+        try:
+            rest += base64.b64decode(pending + b'=' * (-len(pending) % 4))
+        except binascii.Error:
+            return
+
+    if rest:
+        yield rest
+
+
+class SubscriptionClient:
+    def __init__(self,
+                 request_proxies: dict = None,
+                 timeout: float = 30,
+                 workers: int = 16,
+                 chunk_size: int = 65536,
+                 ):
+        self._request_proxies = request_proxies
+        self._timeout = timeout
+        self._workers = workers
+        self._chunk_size = chunk_size
+
+        # one pooled session for all subscriptions
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers.update({'User-agent': USER_AGENT})
+
+        # url -> (etag, last_modified, urls)
+        self._lock = threading.Lock()
+        self._validators = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def fetch(self, url: str):
+        headers = dict()
+        with self._lock:
+            cached = self._validators.get(url)
+        if cached:
+            if cached[0]:
+                headers['If-None-Match'] = cached[0]
+            if cached[1]:
+                headers['If-Modified-Since'] = cached[1]
+
+        with self._session.get(url,
+                               headers=headers,
+                               proxies=self._request_proxies,
+                               timeout=self._timeout,
+                               stream=True,
+                               ) as resp:
+            # not modified
+            if resp.status_code == 304 and cached:
+                for ssr_url in cached[2]:
+                    yield ssr_url
+                return
+
+            if resp.status_code != 200:
+                cp.error('[{}] status: {}'.format(url, resp.status_code))
+                return
+
+            urls = list()
+            seen = set()
+            for line in iter_base64_lines(resp.iter_content(chunk_size=self._chunk_size)):
+                ssr_url = line.decode('utf-8', errors='ignore').strip()
+                if ssr_url and ssr_url not in seen:
+                    seen.add(ssr_url)
+                    urls.append(ssr_url)
+                    yield ssr_url
+
+            with self._lock:
+                self._validators[url] = (resp.headers.get('ETag'), resp.headers.get('Last-Modified'), urls)
+
+    def fetch_many(self, urls):
+        def fetch_list(url: str):
+            try:
+                return list(self.fetch(url))
+            except requests.RequestException as e:
+                cp.error('[{}] {}'.format(url, e))
+                return list()
+
+        with futures.ThreadPoolExecutor(max_workers=self._workers) as executor:
+            jobs = {executor.submit(fetch_list, url): url for url in urls}
+            for future in futures.as_completed(jobs):
+                yield jobs[future], future.result()
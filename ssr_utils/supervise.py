@@ -0,0 +1,102 @@
+# coding:utf-8
+import collections
+import threading
+
+# what shadowsocksr (python) can run, AEAD ciphers of SS are not among them
+SUPPORTED_METHODS = {
+    'none', 'table',
+    'rc4', 'rc4-md5', 'rc4-md5-6',
+    'aes-128-cfb', 'aes-192-cfb', 'aes-256-cfb',
+    'aes-128-cfb8', 'aes-192-cfb8', 'aes-256-cfb8',
+    'aes-128-cfb1', 'aes-192-cfb1', 'aes-256-cfb1',
+    'aes-128-ofb', 'aes-192-ofb', 'aes-256-ofb',
+    'aes-128-ctr', 'aes-192-ctr', 'aes-256-ctr',
+    'camellia-128-cfb', 'camellia-192-cfb', 'camellia-256-cfb',
+    'bf-cfb', 'cast5-cfb', 'des-cfb', 'idea-cfb', 'rc2-cfb', 'seed-cfb',
+    'salsa20', 'xsalsa20', 'chacha20', 'xchacha20', 'chacha20-ietf',
+}
+
+SUPPORTED_PROTOCOLS = {
+    'origin',
+    'verify_deflate',
+    'auth_sha1_v4', 'auth_sha1_v4_compatible',
+    'auth_aes128_md5', 'auth_aes128_sha1',
+    'auth_chain_a', 'auth_chain_b', 'auth_chain_c', 'auth_chain_d', 'auth_chain_e', 'auth_chain_f',
+}
+
+SUPPORTED_OBFS = {
+    'plain',
+    'http_simple', 'http_simple_compatible',
+    'http_post', 'http_post_compatible',
+    'tls1.2_ticket_auth', 'tls1.2_ticket_auth_compatible',
+    'tls1.2_ticket_fastauth', 'tls1.2_ticket_fastauth_compatible',
+    'random_head',
+}
+
+# failure kind, by what the child wrote to stderr, first match wins
+STDERR_PATTERNS = [
+    ('unsupported_method', ['not supported', 'method']),
+    ('unsupported_plugin', ['plugin', 'not supported']),
+    ('bind_error', ['Address already in use']),
+    ('bind_error', ["can't bind"]),
+    ('dns_error', ['Name or service not known']),
+    ('dns_error', ['Temporary failure in name resolution']),
+    ('dns_error', ['getaddrinfo']),
+    ('dns_error', ['unknown host']),
+    ('crashed', ['Traceback']),
+]
+
+# the same config will fail the same way, by IP or by domain
+FATAL_FAILURES = {'rejected', 'unsupported_method', 'unsupported_plugin', 'bind_error'}
+
+# of this machine, not of the node, never cached as a dead node
+LOCAL_FAILURES = {'bind_error', 'ChildProcessError'}
+
+
+def reject_reason(node):
+    # without spawning anything, `None` if it may work
+    if (node.method or '').lower() not in SUPPORTED_METHODS:
+        return 'unsupported method `{}`'.format(node.method)
+    if (node.protocol or '') not in SUPPORTED_PROTOCOLS:
+        return 'unsupported protocol `{}`'.format(node.protocol)
+    if (node.obfs or '') not in SUPPORTED_OBFS:
+        return 'unsupported obfs `{}`'.format(node.obfs)
+
+    try:
+        port = int(node.port)
+    except (TypeError, ValueError):
+        return 'invalid port `{}`'.format(node.port)
+    if not 0 < port < 65536:
+        return 'invalid port `{}`'.format(node.port)
+
+    if not node.server or any(c.isspace() for c in node.server):
+        return 'invalid server `{}`'.format(node.server)
+    return None
+
+
+def classify(stderr: str):
+    for kind, words in STDERR_PATTERNS:
+        if all(word in stderr for word in words):
+            return kind
+    return 'exited'
+
+
+class OutputTail:
+    # drains a pipe in a thread, so the child never blocks on a full buffer, and keeps the last lines
+    def __init__(self, pipe, lines: int = 20):
+        self._pipe = pipe
+        self._lines = collections.deque(maxlen=lines)
+        self._thread = threading.Thread(target=self.__drain, daemon=True)
+        self._thread.start()
+
+    def __drain(self):
+        try:
+            for line in iter(self._pipe.readline, b''):
+                self._lines.append(line.decode('utf-8', errors='ignore').rstrip())
+        except (OSError, ValueError):
+            pass
+
+    def text(self, timeout: float = 1):
+        # after the child is gone, the pipe is at EOF
+        self._thread.join(timeout)
+        return '\n'.join(self._lines)
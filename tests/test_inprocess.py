@@ -0,0 +1,143 @@
+# coding:utf-8
+import socket
+import select
+import threading
+import pytest
+from ssr_utils.net import socks5_socket
+from ssr_utils.inprocess import _RC4
+from ssr_utils.inprocess import METHODS
+from ssr_utils.inprocess import Encryptor
+from ssr_utils.inprocess import LocalServer
+from ssr_utils.inprocess import address_header
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def listen(handle):
+    # loopback, a thread per connection
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(16)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return sock
+
+
+def echo(conn: socket.socket):
+    with conn:
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                return
+            conn.sendall(data)
+
+
+class StandInServer:
+    # SS stream cipher server, only to `target`, a wrong key never parses as it
+    def __init__(self, method: str, password: str, target: tuple):
+        self._method = method
+        self._password = password
+        self._header = address_header(*target)
+        self._target = target
+        self._sock = listen(self.__handle)
+        self.port = self._sock.getsockname()[1]
+
+    def close(self):
+        self._sock.close()
+
+    def __handle(self, conn: socket.socket):
+        encryptor = Encryptor(self._method, self._password)
+        with conn:
+            data = b''
+            while len(data) < len(self._header):
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                data += encryptor.decrypt(chunk)
+            if not data.startswith(self._header):
+                return
+
+            with socket.create_connection(self._target) as remote:
+                remote.sendall(data[len(self._header):])
+                while True:
+                    readable, _, _ = select.select([conn, remote], [], [], 5)
+                    if not readable:
+                        return
+                    for s in readable:
+                        chunk = s.recv(65536)
+                        if not chunk:
+                            return
+                        if s is conn:
+                            remote.sendall(encryptor.decrypt(chunk))
+                        else:
+                            conn.sendall(encryptor.encrypt(chunk))
+
+
+@pytest.fixture
+def target():
+    sock = listen(echo)
+    yield sock.getsockname()
+    sock.close()
+
+
+def round_trip(method: str, password: str, server_password: str, target: tuple):
+    server = StandInServer(method, server_password, target)
+    local_port = free_port()
+    try:
+        with LocalServer(server='127.0.0.1',
+                         port=server.port,
+                         method=method,
+                         password=password,
+                         local_port=local_port,
+                         timeout=2,
+                         ):
+            with socks5_socket('127.0.0.1', local_port, target[0], target[1], timeout=2) as s:
+                s.sendall(b'ping')
+                try:
+                    return s.recv(4)
+                except OSError:
+                    return b''
+    finally:
+        server.close()
+
+
+def test_rc4_vector():
+    # the "Key" / "Plaintext" test vector
+    assert _RC4(b'Key').update(b'Plaintext') == bytes.fromhex('bbf316e8d940af0ad3')
+
+
+@pytest.mark.parametrize('method', sorted(METHODS))
+def test_encryptor_round_trip(method):
+    data = bytes(range(256)) * 4
+    sent = Encryptor(method, 'password').encrypt(data)
+
+    # the IV in pieces
+    decryptor = Encryptor(method, 'password')
+    assert decryptor.decrypt(sent[:3]) + decryptor.decrypt(sent[3:]) == data
+    assert Encryptor(method, 'wrong').decrypt(sent) != data
+
+
+def test_address_header():
+    assert address_header('127.0.0.1', 80) == b'\x01\x7f\x00\x00\x01\x00\x50'
+    assert address_header('example.com', 443) == b'\x03\x0bexample.com\x01\xbb'
+
+
+@pytest.mark.parametrize('method', sorted(METHODS))
+def test_local_server(target, method):
+    assert round_trip(method, 'password', 'password', target) == b'ping'
+
+
+def test_local_server_wrong_password(target):
+    assert round_trip('rc4-md5', 'wrong', 'password', target) == b''